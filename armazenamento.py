@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Camada de armazenamento assíncrona (S3 ou pasta local) usada pelo ETL e pela
+publicação dos artefatos.
+
+- ArmazenamentoS3: client boto3 criado só no primeiro uso, com pool de conexões,
+  e chamadas executadas em threads via asyncio.to_thread (sem aiobotocore).
+- ArmazenamentoLocal: mesma interface sobre uma pasta (testes / execução offline).
+
+ler_varios() baixa vários arquivos em paralelo e entrega os bytes a um pool de
+parsers: downloads só começam quando há vaga entre os arquivos em memória
+(backpressure), e a rede de um arquivo se sobrepõe ao parsing do anterior.
+"""
+
+import os
+import shutil
+import asyncio
+import threading
+
+
+# ==============================
+# Backends
+# ==============================
+class ArmazenamentoLocal:
+    """Arquivos em uma pasta local; `nome` é relativo à raiz."""
+
+    def __init__(self, raiz):
+        self.raiz = raiz
+
+    def __repr__(self):
+        return f"ArmazenamentoLocal({self.raiz!r})"
+
+    def _caminho(self, nome):
+        return os.path.join(self.raiz, nome)
+
+    async def listar(self, prefixo=""):
+        def _listar():
+            nomes = []
+            for pasta, _, arquivos in os.walk(self.raiz):
+                for a in arquivos:
+                    rel = os.path.relpath(os.path.join(pasta, a), self.raiz).replace(os.sep, "/")
+                    if rel.startswith(prefixo):
+                        nomes.append(rel)
+            return sorted(nomes)
+        return await asyncio.to_thread(_listar)
+
+    async def tamanhos(self, prefixo=""):
+        """{nome: bytes} dos arquivos sob `prefixo`."""
+        nomes = await self.listar(prefixo)
+        return await asyncio.to_thread(lambda: {n: os.path.getsize(self._caminho(n)) for n in nomes})
+
+    async def ler(self, nome):
+        def _ler():
+            with open(self._caminho(nome), "rb") as f:
+                return f.read()
+        return await asyncio.to_thread(_ler)
+
+    async def gravar(self, nome, dados):
+        def _gravar():
+            caminho = self._caminho(nome)
+            os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+            with open(caminho, "wb") as f:
+                f.write(dados)
+        await asyncio.to_thread(_gravar)
+
+    async def enviar_arquivo(self, caminho_local, nome):
+        def _copiar():
+            destino = self._caminho(nome)
+            if os.path.abspath(destino) == os.path.abspath(caminho_local):
+                return
+            os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+            shutil.copyfile(caminho_local, destino)
+        await asyncio.to_thread(_copiar)
+
+    def uri(self, nome):
+        return self._caminho(nome)
+
+
+class ArmazenamentoS3:
+    """Objetos em s3://bucket/prefixo<nome>."""
+
+    def __init__(self, bucket, prefixo="", aws_key=None, aws_secret=None, max_conexoes=16):
+        self.bucket = bucket
+        self.prefixo = prefixo
+        self.aws_key = aws_key or None
+        self.aws_secret = aws_secret or None
+        self.max_conexoes = max_conexoes
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"ArmazenamentoS3({self.bucket!r}, {self.prefixo!r})"
+
+    @property
+    def client(self):
+        # criado no primeiro uso; o client boto3 é thread-safe e compartilha o pool
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+                    self._client = boto3.client(
+                        "s3",
+                        aws_access_key_id=self.aws_key,
+                        aws_secret_access_key=self.aws_secret,
+                        config=Config(max_pool_connections=self.max_conexoes),
+                    )
+        return self._client
+
+    async def listar(self, prefixo=""):
+        return list(await self.tamanhos(prefixo))
+
+    async def tamanhos(self, prefixo=""):
+        """{nome: bytes} dos objetos sob `prefixo` (uma listagem, sem HEAD por objeto)."""
+        def _listar():
+            tamanhos = {}
+            pag = self.client.get_paginator("list_objects_v2")
+            for pagina in pag.paginate(Bucket=self.bucket, Prefix=self.prefixo + prefixo):
+                for obj in pagina.get("Contents", []):
+                    tamanhos[obj["Key"][len(self.prefixo):]] = obj["Size"]
+            return tamanhos
+        return await asyncio.to_thread(_listar)
+
+    async def ler(self, nome):
+        def _ler():
+            obj = self.client.get_object(Bucket=self.bucket, Key=self.prefixo + nome)
+            return obj["Body"].read()
+        return await asyncio.to_thread(_ler)
+
+    async def gravar(self, nome, dados):
+        await asyncio.to_thread(self.client.put_object, Bucket=self.bucket, Key=self.prefixo + nome, Body=dados)
+
+    async def enviar_arquivo(self, caminho_local, nome):
+        # upload_file faz multipart para arquivos grandes
+        await asyncio.to_thread(self.client.upload_file, caminho_local, self.bucket, self.prefixo + nome)
+
+    def uri(self, nome):
+        return f"s3://{self.bucket}/{self.prefixo}{nome}"
+
+
+# ==============================
+# Operações concorrentes
+# ==============================
+async def ler_varios(armazenamento, nomes, parser=None, concorrencia=8, parsers=2, em_voo=4):
+    """
+    Lê `nomes` em paralelo (até `concorrencia` downloads simultâneos) e aplica
+    parser(nome, bytes) em até `parsers` threads. Um download só começa quando
+    há vaga entre os `em_voo` arquivos baixando ou aguardando parser, e a vaga
+    só é liberada quando um parser pega o arquivo: no máximo em_voo + parsers
+    arquivos ficam em memória ao mesmo tempo.
+
+    Retorna {nome: (resultado, qtd_bytes)}; em caso de falha o valor é a exceção.
+    """
+    fila = asyncio.Queue()
+    sem = asyncio.Semaphore(concorrencia)
+    vagas = asyncio.Semaphore(max(1, em_voo))
+    resultados = {}
+
+    async def baixar(nome):
+        await vagas.acquire()   # liberada pelo parser ao retirar o arquivo da fila
+        try:
+            async with sem:
+                dados = await armazenamento.ler(nome)
+        except Exception as e:
+            vagas.release()
+            resultados[nome] = e
+            return
+        fila.put_nowait((nome, dados))
+
+    async def processar():
+        while True:
+            item = await fila.get()
+            if item is None:
+                return
+            vagas.release()
+            nome, dados = item
+            try:
+                res = await asyncio.to_thread(parser, nome, dados) if parser else dados
+                resultados[nome] = (res, len(dados))
+            except Exception as e:
+                resultados[nome] = e
+            del item, dados   # não segura os bytes enquanto espera o próximo
+
+    workers = [asyncio.create_task(processar()) for _ in range(max(1, parsers))]
+    await asyncio.gather(*(baixar(n) for n in nomes))
+    for _ in workers:
+        fila.put_nowait(None)
+    await asyncio.gather(*workers)
+    return {n: resultados[n] for n in nomes}
+
+
+async def enviar_varios(armazenamento, arquivos, concorrencia=8):
+    """
+    Envia arquivos locais (mesmo nome relativo no destino) em paralelo.
+    Retorna {arquivo: uri | exceção}; arquivos inexistentes são ignorados.
+    """
+    sem = asyncio.Semaphore(concorrencia)
+
+    async def enviar(f):
+        async with sem:
+            try:
+                await armazenamento.enviar_arquivo(f, f.replace(os.sep, "/"))
+                return armazenamento.uri(f.replace(os.sep, "/"))
+            except Exception as e:
+                return e
+
+    existentes = [f for f in arquivos if os.path.exists(f)]
+    res = await asyncio.gather(*(enviar(f) for f in existentes))
+    return dict(zip(existentes, res))
+
+
+def executar(coro):
+    """
+    Roda uma corrotina a partir de código síncrono (scripts do pipeline). Se já
+    houver um loop rodando nesta thread (notebook, servidor assíncrono), a
+    corrotina roda num loop próprio em outra thread e a chamada bloqueia até o fim.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        return ex.submit(asyncio.run, coro).result()
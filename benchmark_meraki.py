@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark do pipeline Meraki Match sobre dados sintéticos (sintetico_meraki.py).
+
+Para cada escala (qtde de clientes) gera os arquivos de origem, roda cada etapa
+do ETL, da clusterização/recomendação e dos visuais uma única vez, medindo
+tempo de parede, tempo de CPU e memória (pico de RSS da etapa e o quanto ele
+subiu acima do RSS do início dela), grava os resultados em JSON e compara com
+um baseline salvo, sinalizando regressões.
+
+Uso:
+    python benchmark_meraki.py --escalas 10000,100000
+    python benchmark_meraki.py --escalas 10000 --salvar-baseline
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+import resource
+from datetime import datetime
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+if AQUI not in sys.path:
+    sys.path.insert(0, AQUI)
+
+
+# ==============================
+# Etapas
+# ==============================
+def _etapas():
+    """
+    Lista de (nome, função) na ordem do pipeline. As etapas conversam por
+    arquivos na pasta corrente e pelo dicionário `estado` (objetos em memória).
+    """
+    import etl_s3_totvs as etl
+    import meraki_cluster_recomendacao as mcr
+    import visual
+
+    def preparar(estado):
+        estado["df"], estado["X"], estado["X_scaled"], estado["feat_names"] = \
+            mcr.preparar_features(estado["base"])
+
+    def treinar(estado):
+        estado["modelo"] = mcr.treinar_kmeans(estado["X_scaled"], ks=[3, 4, 5, 6],
+                                              random_state=42, amostra_silhouette=20000)
+        estado["labels"] = estado["modelo"].predict(estado["X_scaled"])
+
+    return [
+        ("tratar_nps",                      lambda e: etl.tratar_nps()),
+        ("tratar_tickets",                  lambda e: etl.tratar_tickets()),
+        ("tratar_vendas",                   lambda e: etl.tratar_vendas()),
+        ("tratar_clientes",                 lambda e: etl.tratar_clientes()),
+        ("tratar_telemetria",               lambda e: etl.tratar_telemetria()),
+        ("construir_base_analitica",        lambda e: etl.construir_base_analitica()),
+        ("carregar_ou_construir_base",      lambda e: e.update(base=mcr.carregar_ou_construir_base())),
+        ("preparar_features",               preparar),
+        ("treinar_kmeans",                  treinar),
+        ("salvar_resultados",               lambda e: mcr.salvar_resultados(e["df"], e["X"], e["labels"], e["feat_names"])),
+        ("gerar_recomendacoes",             lambda e: mcr.gerar_recomendacoes(e["labels"])),
+        ("grafico_distribuicao_clusters",   lambda e: visual.grafico_distribuicao_clusters()),
+        ("grafico_medias_features",         lambda e: visual.grafico_medias_features()),
+        ("planilha_top_produtos",           lambda e: visual.planilha_top_produtos()),
+        ("gerar_rotulos_clusters",          lambda e: visual.gerar_rotulos_clusters()),
+        ("grafico_nps_medio_por_cluster",   lambda e: visual.grafico_nps_medio_por_cluster()),
+        ("grafico_boxplot_mrr_por_cluster", lambda e: visual.grafico_boxplot_mrr_por_cluster()),
+        ("grafico_composicao_segmento",     lambda e: visual.grafico_composicao_segmento()),
+        ("grafico_top_produtos_por_cluster", lambda e: visual.grafico_top_produtos_por_cluster()),
+    ]
+
+
+def _rss_atual_mb():
+    """RSS atual do processo (VmRSS no Linux; ru_maxrss nos demais, que é cumulativo)."""
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss: KB no Linux, bytes no macOS
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1024 * 1024) if sys.platform == "darwin" else r / 1024
+
+
+def _medir(nome, func, estado, memoria):
+    """
+    Executa a etapa uma única vez dentro de medir_etapa: o pico de RSS é
+    reiniciado no início (Linux) e as @etapa internas ficam aninhadas, sem
+    zerá-lo no meio. rss_delta_mb = pico da etapa - RSS no início dela.
+    Sem o reinício (rss_pico_isolado=False) o pico é o cumulativo do processo.
+    """
+    from instrumentacao import medir_etapa
+
+    gc.collect()
+    rss_inicio = _rss_atual_mb()
+    with medir_etapa(f"bench_{nome}") as reg:
+        func(estado)
+    resultado = {"tempo_s": reg["tempo_s"], "cpu_s": reg["cpu_s"]}
+    if memoria and reg.get("rss_pico_mb") is not None:
+        resultado["rss_pico_mb"] = reg["rss_pico_mb"]
+        resultado["rss_pico_isolado"] = reg["rss_pico_isolado"]
+        resultado["rss_delta_mb"] = round(max(reg["rss_pico_mb"] - rss_inicio, 0.0), 1)
+    return resultado
+
+
+def rodar_escala(n_clientes, pasta_trabalho, etapas_sel=None, memoria=True, seed=42):
+    """Gera os dados de uma escala e mede todas as etapas. Retorna lista de resultados."""
+    from sintetico_meraki import gerar_dados_sinteticos
+
+    pasta = os.path.abspath(os.path.join(pasta_trabalho, f"escala_{n_clientes}"))
+    dados = os.path.join(pasta, "dados")
+    t0 = time.perf_counter()
+    gerar_dados_sinteticos(n_clientes, dados, seed=seed)
+    print(f" Geração ({n_clientes}): {time.perf_counter() - t0:.1f}s")
+
+    cwd, env_antigo = os.getcwd(), os.environ.get("MERAKI_DADOS_DIR")
+    os.environ["MERAKI_DADOS_DIR"] = dados
+    os.chdir(pasta)
+    resultados, estado = [], {}
+    try:
+        for nome, func in _etapas():
+            # etapas não selecionadas rodam mesmo assim (produzem as entradas das próximas),
+            # mas não são registradas
+            medir = etapas_sel is None or nome in etapas_sel
+            try:
+                if not medir:
+                    func(estado)
+                    continue
+                r = _medir(nome, func, estado, memoria)
+            except Exception as e:
+                # uma etapa quebrada não derruba o benchmark inteiro
+                print(f"[bench] {n_clientes:>9} | {nome:<34} | ERRO: {e}")
+                if medir:
+                    resultados.append({"escala": n_clientes, "etapa": nome, "erro": str(e)})
+                continue
+            r.update({"escala": n_clientes, "etapa": nome})
+            resultados.append(r)
+            print(f"[bench] {n_clientes:>9} | {nome:<34} | {r['tempo_s']:8.3f}s"
+                  + (f" | +{r['rss_delta_mb']:8.1f} MB" if "rss_delta_mb" in r else ""))
+    finally:
+        os.chdir(cwd)
+        if env_antigo is None:
+            os.environ.pop("MERAKI_DADOS_DIR", None)
+        else:
+            os.environ["MERAKI_DADOS_DIR"] = env_antigo
+    return resultados
+
+
+# ==============================
+# Orçamento de inicialização da CLI
+# ==============================
+MODULOS_PESADOS = ("pandas", "numpy", "sklearn", "matplotlib", "boto3", "scipy")
+
+def verificar_orcamento_import(limite_ms=200, repeticoes=5):
+    """
+    Mede a inicialização a frio de `meraki.py --help` (e do --help de cada
+    subcomando) em subprocessos e confere que a CLI não importa bibliotecas
+    pesadas antes de executar um subcomando. Retorna lista de falhas.
+    """
+    import subprocess
+    cli = os.path.join(AQUI, "meraki.py")
+    falhas = []
+
+    comandos = [["--help"]] + [[c, "--help"] for c in ("etl", "cluster", "recommend", "visuals", "serve")]
+    for cmd in comandos:
+        tempos = []
+        for _ in range(repeticoes):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable, cli] + cmd, stdout=subprocess.DEVNULL, check=True)
+            tempos.append((time.perf_counter() - t0) * 1000)
+        melhor = min(tempos)
+        ok = melhor <= limite_ms
+        print(f"[import] meraki {' '.join(cmd):<18} | {melhor:7.1f} ms | {'ok' if ok else 'ACIMA DO LIMITE'}")
+        if not ok:
+            falhas.append(f"meraki {' '.join(cmd)}: {melhor:.1f} ms > {limite_ms} ms")
+
+    codigo = ("import sys; sys.path.insert(0, %r); import meraki; meraki.criar_parser(); "
+              "print(','.join(m for m in %r if m in sys.modules))" % (AQUI, MODULOS_PESADOS))
+    carregados = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    if carregados:
+        falhas.append(f"import de meraki carrega módulos pesados: {carregados}")
+    print(f"[import] módulos pesados no import da CLI: {carregados or 'nenhum'}")
+    return falhas
+
+
+# ==============================
+# Baseline / regressões
+# ==============================
+def comparar_baseline(resultados, baseline, tolerancia=1.25, minimo_s=0.05, minimo_mb=10.0):
+    """
+    Compara cada (escala, etapa) com o baseline. Regressão: métrica acima de
+    baseline * tolerancia (tempo/memória só contam se a diferença passar de
+    minimo_s/minimo_mb).
+    """
+    ref = {(b["escala"], b["etapa"]): b for b in baseline.get("resultados", [])}
+    regressoes = []
+    for r in resultados:
+        b = ref.get((r["escala"], r["etapa"]))
+        if b is None:
+            continue
+        if "erro" in r:
+            if "erro" not in b:
+                regressoes.append({"escala": r["escala"], "etapa": r["etapa"], "metrica": "erro",
+                                   "baseline": 0.0, "atual": 1.0})
+            continue
+        if "erro" in b:
+            continue
+        if r["tempo_s"] > b["tempo_s"] * tolerancia and r["tempo_s"] - b["tempo_s"] > minimo_s:
+            regressoes.append({"escala": r["escala"], "etapa": r["etapa"], "metrica": "tempo_s",
+                               "baseline": b["tempo_s"], "atual": r["tempo_s"]})
+        if "rss_delta_mb" in r and "rss_delta_mb" in b and r["rss_delta_mb"] > b["rss_delta_mb"] * tolerancia \
+                and r["rss_delta_mb"] - b["rss_delta_mb"] > minimo_mb:
+            regressoes.append({"escala": r["escala"], "etapa": r["etapa"], "metrica": "rss_delta_mb",
+                               "baseline": b["rss_delta_mb"], "atual": r["rss_delta_mb"]})
+    return regressoes
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Meraki Match – Benchmark do pipeline")
+    p.add_argument("--escalas", default="10000,100000,1000000",
+                   help="Qtdes de clientes separadas por vírgula (padrão: 10000,100000,1000000)")
+    p.add_argument("--etapas", default="", help="Mede apenas estas etapas (separadas por vírgula)")
+    p.add_argument("--trabalho", default="bench_trabalho", help="Pasta de trabalho (padrão: bench_trabalho)")
+    p.add_argument("--saida", default="bench_resultados.json", help="Arquivo de resultados (JSON)")
+    p.add_argument("--baseline", default="bench_baseline.json", help="Baseline para detectar regressões")
+    p.add_argument("--salvar-baseline", action="store_true", help="Grava os resultados como novo baseline")
+    p.add_argument("--tolerancia", type=float, default=1.25, help="Fator tolerado sobre o baseline (padrão=1.25)")
+    p.add_argument("--sem-memoria", action="store_true", help="Não registra as medidas de memória (RSS)")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--orcamento-import", action="store_true",
+                   help="Só verifica o tempo de inicialização da CLI (meraki.py) e sai")
+    p.add_argument("--limite-import-ms", type=float, default=200, help="Orçamento de inicialização (padrão=200 ms)")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.orcamento_import:
+        falhas = verificar_orcamento_import(args.limite_import_ms)
+        for f in falhas:
+            print(f"⚠️ {f}")
+        return 1 if falhas else 0
+    escalas = [int(e) for e in args.escalas.split(",") if e.strip()]
+    etapas_sel = set(e.strip() for e in args.etapas.split(",") if e.strip()) or None
+
+    resultados = []
+    for n in escalas:
+        resultados += rodar_escala(n, args.trabalho, etapas_sel, memoria=not args.sem_memoria, seed=args.seed)
+
+    saida = {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "memoria": not args.sem_memoria,
+        "resultados": resultados,
+    }
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(saida, f, indent=2, ensure_ascii=False)
+    print(f" {args.saida} salvo.")
+
+    regressoes = []
+    if os.path.exists(args.baseline) and not args.salvar_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressoes = comparar_baseline(resultados, json.load(f), args.tolerancia)
+        for r in regressoes:
+            print(f"⚠️ REGRESSÃO {r['etapa']} ({r['escala']}): {r['metrica']} "
+                  f"{r['baseline']:.3f} -> {r['atual']:.3f}")
+        if not regressoes:
+            print(f"✅ Sem regressões em relação a {args.baseline}.")
+
+    if args.salvar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(saida, f, indent=2, ensure_ascii=False)
+        print(f" Baseline salvo em {args.baseline}.")
+
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
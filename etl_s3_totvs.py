@@ -1,8 +1,12 @@
 # etl_s3_totvs.py
+import os
 import pandas as pd
-import boto3
 import io
 
+from instrumentacao import etapa, registrar, resumo_execucao
+from qualidade_dados import (CHAVES_CLIENTE, linhas_malformadas,
+                             validar, registrar_arquivo, gravar_relatorio)
+
 # S3 Credentials
 
 AWS_ACCESS_KEY = os.environ.get('AWS_ACCESS_KEY_ID')
@@ -10,27 +14,111 @@ AWS_SECRET_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
 BUCKET_NAME = 'fiap-meraki-match-totvs'
 PASTA = 'dados/'
 
-s3 = boto3.client(
-    "s3",
-    aws_access_key_id=AWS_ACCESS_KEY,
-    aws_secret_access_key=AWS_SECRET_KEY,
-)
+FONTES_NPS = [
+    "nps_relacional.csv",
+    "nps_transacional_aquisicao.csv",
+    "nps_transacional_implantacao.csv",
+    "nps_transacional_onboarding.csv",
+    "nps_transacional_produto.csv",
+    "nps_transacional_suporte.csv",
+]
+FONTES_TELEMETRIA = [f"telemetria_{i}.csv" for i in range(1, 12)]
+FONTES = (FONTES_NPS + ["tickets.csv", "mrr.csv", "contratacoes_ultimos_12_meses.csv",
+                        "dados_clientes.csv", "clientes_desde.csv", "historico.csv"]
+          + FONTES_TELEMETRIA)
+
+_armazenamento = None
+_pre_lidos = {}   # (origem, nome) -> (DataFrame, bytes) | exceção, lidos por ler_fontes()
+
+def obter_armazenamento():
+    """
+    Origem dos arquivos brutos, criada só no primeiro uso (o import não depende
+    de boto3/rede). Com MERAKI_DADOS_DIR definido, lê de uma pasta local
+    (ex.: dados sintéticos de sintetico_meraki.py); senão, do bucket S3.
+    """
+    global _armazenamento
+    from armazenamento import ArmazenamentoLocal, ArmazenamentoS3
+    pasta_local = os.environ.get("MERAKI_DADOS_DIR")
+    if pasta_local:
+        if not isinstance(_armazenamento, ArmazenamentoLocal) or _armazenamento.raiz != pasta_local:
+            _armazenamento = ArmazenamentoLocal(pasta_local)
+    elif not isinstance(_armazenamento, ArmazenamentoS3):
+        _armazenamento = ArmazenamentoS3(BUCKET_NAME, PASTA, AWS_ACCESS_KEY, AWS_SECRET_KEY)
+    return _armazenamento
 
 # Utils
 
-def ler_csv(nome_arquivo: str) -> pd.DataFrame:
-    """Lê um CSV do S3 com fallback de encoding e separador ';'."""
-    key = f"{PASTA}{nome_arquivo}"
-    obj = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-    conteudo = obj["Body"].read()
+def _parse_csv(nome_arquivo: str, conteudo: bytes) -> pd.DataFrame:
+    """
+    CSV com separador ';' e fallback de encoding UTF-8 -> Latin-1, já validado
+    por qualidade_dados (linhas malformadas e reprovadas vão para a quarentena).
+    """
     try:
-        return pd.read_csv(io.BytesIO(conteudo), encoding="utf-8", sep=";", on_bad_lines="skip")
+        df = pd.read_csv(io.BytesIO(conteudo), encoding="utf-8", sep=";", on_bad_lines="skip")
+        encoding = "utf-8"
     except UnicodeDecodeError:
         print(f" Aviso: {nome_arquivo} não está em UTF-8. Tentando Latin-1...")
-        return pd.read_csv(io.BytesIO(conteudo), encoding="latin1", sep=";", on_bad_lines="skip")
+        encoding = "latin1"
+        df = pd.read_csv(io.BytesIO(conteudo), encoding=encoding, sep=";", on_bad_lines="skip")
+    return validar(nome_arquivo, df, linhas_malformadas(conteudo, encoding, df))
+
+@etapa
+def ler_fontes(limite_mb, nomes=None):
+    """
+    Pré-carrega as fontes do ETL (padrão: FONTES, na ordem dos blocos) numa
+    única rodada de ler_varios, para que os downloads se sobreponham entre os
+    blocos tratar_*, que consomem esses resultados via ler_varios_csv. Opcional
+    (meraki.py etl --pre-carregar MB): só entram as primeiras fontes cujo
+    tamanho bruto somado cabe em `limite_mb`; as demais são lidas pelo próprio
+    bloco, como sem pré-carga.
+    """
+    from armazenamento import ler_varios, executar
+    armaz = obter_armazenamento()
+    tamanhos = executar(armaz.tamanhos())
+    selecionados, total = [], 0
+    for nome in (nomes or FONTES):
+        if total + tamanhos.get(nome, 0) > limite_mb * 1024 ** 2:
+            break
+        total += tamanhos.get(nome, 0)
+        selecionados.append(nome)
+    print(f" Pré-carga: {len(selecionados)} de {len(nomes or FONTES)} fontes ({total / 1024 ** 2:.1f} MB brutos).")
+    brutos = executar(ler_varios(armaz, selecionados, parser=_parse_csv)) if selecionados else {}
+    _pre_lidos.update(((repr(armaz), nome), res) for nome, res in brutos.items())
+
+def ler_varios_csv(nomes) -> dict:
+    """
+    Lê vários CSVs da origem em paralelo, sobrepondo download e parsing.
+    Arquivos já lidos por ler_fontes() são reaproveitados (e liberados).
+    Retorna {nome: DataFrame | exceção}, na ordem de `nomes`.
+    """
+    from armazenamento import ArmazenamentoS3, ler_varios, executar
+    armaz = obter_armazenamento()
+    nomes = list(nomes)
+    faltam = [n for n in nomes if (repr(armaz), n) not in _pre_lidos]
+    brutos = executar(ler_varios(armaz, faltam, parser=_parse_csv)) if faltam else {}
+    brutos = {n: brutos[n] if n in brutos else _pre_lidos.pop((repr(armaz), n)) for n in nomes}
+    saida = {}
+    for nome, res in brutos.items():
+        if isinstance(res, Exception):
+            saida[nome] = res
+            continue
+        df, n_bytes = res
+        if isinstance(armaz, ArmazenamentoS3):
+            registrar("bytes_s3", n_bytes)
+        registrar("linhas_entrada", len(df))
+        saida[nome] = df
+    return saida
+
+def ler_csv(nome_arquivo: str) -> pd.DataFrame:
+    """Lê um CSV da origem (S3 ou MERAKI_DADOS_DIR) com fallback de encoding e separador ';'."""
+    res = ler_varios_csv([nome_arquivo])[nome_arquivo]
+    if isinstance(res, Exception):
+        raise res
+    return res
 
 def salvar_local(df: pd.DataFrame, nome_saida: str):
     df.to_csv(f"{nome_saida}.csv", index=False, encoding="utf-8")
+    registrar("linhas_saida", len(df))
     print(f"{nome_saida}.csv salvo com sucesso.")
 
 def uniformiza_chave_cliente(df: pd.DataFrame) -> pd.DataFrame:
@@ -39,11 +127,7 @@ def uniformiza_chave_cliente(df: pd.DataFrame) -> pd.DataFrame:
     Copia de alternativas comuns: CLIENTE, IdCliente, ID_CLIENTE, COD_CLIENTE, CODIGO_CLIENTE,
     CD_CLI, metadata_codcliente.
     """
-    possiveis = [
-        "CD_CLIENTE", "CLIENTE", "IdCliente", "ID_CLIENTE",
-        "COD_CLIENTE", "CODIGO_CLIENTE", "CD_CLI", "metadata_codcliente"
-    ]
-    existentes = [c for c in possiveis if c in df.columns]
+    existentes = [c for c in CHAVES_CLIENTE if c in df.columns]
     if not existentes:
         return df
     src = existentes[0]
@@ -54,23 +138,15 @@ def uniformiza_chave_cliente(df: pd.DataFrame) -> pd.DataFrame:
 
 # ---------- Blocos de tratamento ----------
 
+@etapa
 def tratar_nps():
-    arquivos = [
-        "nps_relacional.csv",
-        "nps_transacional_aquisicao.csv",
-        "nps_transacional_implantacao.csv",
-        "nps_transacional_onboarding.csv",
-        "nps_transacional_produto.csv",
-        "nps_transacional_suporte.csv",
-    ]
     dfs = []
-    for nome in arquivos:
-        try:
-            df = ler_csv(nome)
-            df["origem_nps"] = nome.replace(".csv", "")
-            dfs.append(df)
-        except Exception as e:
-            print(f" Falha lendo {nome}: {e}")
+    for nome, df in ler_varios_csv(FONTES_NPS).items():
+        if isinstance(df, Exception):
+            print(f" Falha lendo {nome}: {df}")
+            continue
+        df["origem_nps"] = nome.replace(".csv", "")
+        dfs.append(df)
 
     if not dfs:
         print("⚠ NPS: nenhum arquivo lido com sucesso.")
@@ -90,12 +166,15 @@ def tratar_nps():
 
     salvar_local(nps, "nps_tratado")
 
+@etapa
 def tratar_tickets():
     df = ler_csv("tickets.csv")
     print(" Colunas disponíveis em tickets.csv:", df.columns.tolist())
     df = df.dropna(how="all").drop_duplicates()
 
-    # cria 'TempoResolucao' se houver alguma coluna parecida; senão, preenche zero
+    # cria 'TempoResolucao' se houver alguma coluna parecida (valores vazios ou
+    # inválidos viram 0, contados no relatório de qualidade); senão, fica vazio
+    # (zero distorceria TEMPO_MEDIO_RES) e a ausência vai para o relatório
     tempo_col = None
     for col in df.columns:
         norm = (col.lower()
@@ -108,10 +187,15 @@ def tratar_tickets():
             tempo_col = col
             break
     if tempo_col:
-        df["TempoResolucao"] = pd.to_numeric(df[tempo_col], errors="coerce").fillna(0)
+        tempo = pd.to_numeric(df[tempo_col], errors="coerce")
+        invalidos = int((df[tempo_col].notna() & tempo.isna()).sum())
+        if invalidos:
+            registrar_arquivo("tickets.csv", "NUMERICO_INVALIDO", tempo_col, len(df), invalidos)
+        df["TempoResolucao"] = tempo.fillna(0)
     else:
-        print(" Coluna de tempo de resolução não encontrada. Preenchendo com 0.")
-        df["TempoResolucao"] = 0
+        print(" Coluna de tempo de resolução não encontrada; TempoResolucao fica vazio.")
+        registrar_arquivo("tickets.csv", "COLUNA_AUSENTE", "TempoResolucao", len(df))
+        df["TempoResolucao"] = float("nan")
 
     # uniformiza chave, se existir
     df = uniformiza_chave_cliente(df)
@@ -127,9 +211,13 @@ def tratar_tickets():
                  .reset_index())
         salvar_local(agg, "tickets_agg_organizacao")
 
+@etapa
 def tratar_vendas():
-    vendas = ler_csv("mrr.csv")
-    contratos = ler_csv("contratacoes_ultimos_12_meses.csv")
+    lidos = ler_varios_csv(["mrr.csv", "contratacoes_ultimos_12_meses.csv"])
+    for res in lidos.values():
+        if isinstance(res, Exception):
+            raise res
+    vendas, contratos = lidos["mrr.csv"], lidos["contratacoes_ultimos_12_meses.csv"]
 
     print(" Colunas em mrr.csv:", vendas.columns.tolist())
     print(" Colunas em contratacoes_ultimos_12_meses.csv:", contratos.columns.tolist())
@@ -138,24 +226,22 @@ def tratar_vendas():
     vendas = uniformiza_chave_cliente(vendas)
     contratos = uniformiza_chave_cliente(contratos)
 
-    # numéricos
-    if "MRR_12M" in vendas.columns:
+    # numéricos (qualidade_dados já entrega MRR/contratações em float)
+    if "MRR_12M" in vendas.columns and not pd.api.types.is_numeric_dtype(vendas["MRR_12M"]):
         vendas["MRR_12M"] = (
             vendas["MRR_12M"].astype(str).str.replace(",", ".", regex=False)
         )
         vendas["MRR_12M"] = pd.to_numeric(vendas["MRR_12M"], errors="coerce")
 
     for col in ["QTD_CONTRATACOES_12M", "VLR_CONTRATACOES_12M"]:
-        if col in contratos.columns:
+        if col in contratos.columns and not pd.api.types.is_numeric_dtype(contratos[col]):
             contratos[col] = (
                 contratos[col].astype(str).str.replace(",", ".", regex=False)
             )
             contratos[col] = pd.to_numeric(contratos[col], errors="coerce")
 
     if "CD_CLIENTE" not in vendas.columns or "CD_CLIENTE" not in contratos.columns:
-        print(" Não foi possível identificar a chave de cliente em mrr/contratos.")
-        salvar_local(vendas, "mrr_sem_merge_inspecao")
-        salvar_local(contratos, "contratos_sem_merge_inspecao")
+        print(" Não foi possível identificar a chave de cliente em mrr/contratos (ver qualidade_relatorio.csv).")
         return
 
     df = pd.merge(vendas, contratos, how="left", on="CD_CLIENTE")
@@ -163,10 +249,13 @@ def tratar_vendas():
 
     salvar_local(df, "vendas_tratado")
 
+@etapa
 def tratar_clientes():
-    base = ler_csv("dados_clientes.csv")
-    desde = ler_csv("clientes_desde.csv")
-    historico = ler_csv("historico.csv")
+    lidos = ler_varios_csv(["dados_clientes.csv", "clientes_desde.csv", "historico.csv"])
+    for res in lidos.values():
+        if isinstance(res, Exception):
+            raise res
+    base, desde, historico = lidos["dados_clientes.csv"], lidos["clientes_desde.csv"], lidos["historico.csv"]
 
     print(" Colunas em dados_clientes.csv:", base.columns.tolist())
     print(" Colunas em clientes_desde.csv:", desde.columns.tolist())
@@ -177,8 +266,7 @@ def tratar_clientes():
     historico = uniformiza_chave_cliente(historico)
 
     if "CD_CLIENTE" not in base.columns:
-        print(" Não foi possível identificar a chave de cliente em dados_clientes.csv")
-        salvar_local(base, "dados_clientes_inspecao")
+        print(" Não foi possível identificar a chave de cliente em dados_clientes.csv (ver qualidade_relatorio.csv).")
         return
 
     df = base.copy()
@@ -186,29 +274,26 @@ def tratar_clientes():
     if "CD_CLIENTE" in desde.columns:
         df = pd.merge(df, desde, how="left", on="CD_CLIENTE")
     else:
-        print(" clientes_desde.csv sem chave unificada; salvando para inspeção.")
-        salvar_local(desde, "clientes_desde_inspecao")
+        print(" clientes_desde.csv sem chave unificada; ignorado (ver qualidade_relatorio.csv).")
 
     if "CD_CLIENTE" in historico.columns:
         df = pd.merge(df, historico, how="left", on="CD_CLIENTE")
     else:
-        print(" historico.csv sem chave unificada; salvando para inspeção.")
-        salvar_local(historico, "historico_inspecao")
+        print(" historico.csv sem chave unificada; ignorado (ver qualidade_relatorio.csv).")
 
     df = df.dropna(how="all").drop_duplicates()
     salvar_local(df, "clientes_tratado")
 
+@etapa
 def tratar_telemetria():
     dfs = []
-    for i in range(1, 12):
-        nome = f"telemetria_{i}.csv"
-        try:
-            df = ler_csv(nome)
-            df["fonte"] = nome
-            df = uniformiza_chave_cliente(df)
-            dfs.append(df)
-        except Exception as e:
-            print(f"️ Telemetria: falha lendo {nome}: {e}")
+    for nome, df in ler_varios_csv(FONTES_TELEMETRIA).items():
+        if isinstance(df, Exception):
+            print(f"️ Telemetria: falha lendo {nome}: {df}")
+            continue
+        df["fonte"] = nome
+        df = uniformiza_chave_cliente(df)
+        dfs.append(df)
 
     if not dfs:
         print(" Nenhum arquivo de telemetria lido.")
@@ -218,6 +303,7 @@ def tratar_telemetria():
     df_tele = df_tele.dropna(how="all").drop_duplicates()
     salvar_local(df_tele, "telemetria_tratado")
 
+@etapa
 def construir_base_analitica():
     """
     Constrói dataset consolidado por CD_CLIENTE:
@@ -272,4 +358,6 @@ if __name__ == "__main__":
     tratar_clientes()
     tratar_telemetria()
     construir_base_analitica()
+    gravar_relatorio()
     print(" ETL finalizado.")
+    resumo_execucao()
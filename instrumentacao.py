@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentação das etapas do pipeline Meraki Match.
+
+Cada etapa decorada com @etapa (ou envolvida por `with medir_etapa(...)`) gera
+um registro com tempo de parede, tempo de CPU, pico de RSS, linhas de entrada e
+saída, bytes lidos do S3 e cache hits. Os registros são resumidos em tabela por
+resumo_execucao() e, só se MERAKI_LOG_JSON estiver definido (ou com
+`meraki.py --log-json`), gravados em JSON lines nesse arquivo ("-" = stderr).
+
+Perfilamento de uma etapa escolhida:
+    MERAKI_PERFIL_ETAPA=treinar_kmeans   -> cProfile em perfil_treinar_kmeans.prof
+    MERAKI_PERFIL_ESPERA=10              -> pausa 10s no início da etapa, com o PID
+                                            impresso, para anexar `py-spy record --pid`
+"""
+
+import os
+import sys
+import json
+import time
+import functools
+import contextlib
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MAX_REGISTROS = 10_000   # processos longos (serve) descartam os registros mais antigos
+
+_registros = []   # registros de etapa desde o último resumo_execucao()
+_pilha = []       # etapas em andamento (aninhamento)
+
+
+# ==============================
+# Memória
+# ==============================
+def _rss_pico_mb():
+    """Pico de RSS do processo (VmHWM no Linux; ru_maxrss nos demais)."""
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmHWM:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1024 * 1024) if sys.platform == "darwin" else r / 1024
+
+def _zerar_pico_rss():
+    """Reinicia o VmHWM (Linux >= 4.0) para medir o pico de cada etapa isoladamente."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# ==============================
+# Saída
+# ==============================
+def _emitir(registro):
+    destino = os.environ.get("MERAKI_LOG_JSON", "")
+    if not destino:
+        return
+    linha = json.dumps(registro, ensure_ascii=False, default=str)
+    if destino == "-":
+        print(linha, file=sys.stderr)
+        return
+    with open(destino, "a", encoding="utf-8") as f:
+        f.write(linha + "\n")
+
+def evento(nome, **campos):
+    """Grava um evento avulso no log (ex.: silhouette de cada k)."""
+    reg = {"evento": nome, "ts": datetime.now().isoformat(timespec="milliseconds")}
+    if _pilha:
+        reg["etapa"] = _pilha[-1]["etapa"]
+    reg.update(campos)
+    _emitir(reg)
+
+def registrar(chave, valor=1):
+    """
+    Soma `valor` ao contador `chave` de todas as etapas em andamento.
+    Contadores usados: linhas_entrada, linhas_saida, bytes_s3, cache_hits.
+    """
+    for reg in _pilha:
+        reg[chave] = reg.get(chave, 0) + valor
+
+
+# ==============================
+# Medição
+# ==============================
+def _linhas(obj):
+    if isinstance(obj, tuple):
+        obj = next((o for o in obj if hasattr(o, "shape")), None)
+    if obj is not None and hasattr(obj, "shape") and len(getattr(obj, "shape", ())) > 0:
+        return int(obj.shape[0])
+    return None
+
+@contextlib.contextmanager
+def medir_etapa(nome, entrada=None):
+    """Context manager que mede o bloco como uma etapa `nome`."""
+    reg = {
+        "evento": "etapa", "etapa": nome, "pid": os.getpid(),
+        "inicio": datetime.now().isoformat(timespec="milliseconds"),
+    }
+    if entrada is not None:
+        reg["linhas_entrada"] = entrada
+
+    perfil = None
+    if os.environ.get("MERAKI_PERFIL_ETAPA") == nome:
+        espera = float(os.environ.get("MERAKI_PERFIL_ESPERA", "0") or 0)
+        if espera > 0:
+            print(f" [{nome}] PID {os.getpid()} – aguardando {espera:.0f}s (py-spy record --pid {os.getpid()})")
+            time.sleep(espera)
+        import cProfile
+        perfil = cProfile.Profile()
+
+    reg["nivel"] = len(_pilha)
+    isolado = _zerar_pico_rss() if not _pilha else False
+    _pilha.append(reg)
+    t0, c0 = time.perf_counter(), time.process_time()
+    if perfil is not None:
+        perfil.enable()
+    try:
+        yield reg
+    except BaseException as e:
+        reg["erro"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if perfil is not None:
+            perfil.disable()
+            saida = f"perfil_{nome}.prof"
+            perfil.dump_stats(saida)
+            reg["perfil"] = saida
+        reg["tempo_s"] = round(time.perf_counter() - t0, 6)
+        reg["cpu_s"] = round(time.process_time() - c0, 6)
+        pico = _rss_pico_mb()
+        reg["rss_pico_mb"] = round(pico, 1) if pico is not None else None
+        reg["rss_pico_isolado"] = isolado
+        _pilha.pop()
+        _guardar(reg)
+        _emitir(reg)
+
+def etapa(nome=None):
+    """
+    Decorador de etapa. Uso: @etapa ou @etapa("nome").
+    Linhas de entrada/saída são inferidas do 1º argumento e do retorno quando
+    forem DataFrame/ndarray; etapas que leem/gravam arquivos usam registrar().
+    """
+    def decorar(func):
+        rotulo = nome or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            entrada = _linhas(args[0]) if args else None
+            with medir_etapa(rotulo, entrada=entrada) as reg:
+                resultado = func(*args, **kwargs)
+                saida = _linhas(resultado)
+                if saida is not None and "linhas_saida" not in reg:
+                    reg["linhas_saida"] = saida
+                return resultado
+        return wrapper
+
+    if callable(nome):  # @etapa sem parênteses
+        func, nome = nome, None
+        return decorar(func)
+    return decorar
+
+
+# ==============================
+# Resumo
+# ==============================
+def _guardar(reg):
+    _registros.append(reg)
+    if len(_registros) > MAX_REGISTROS:
+        del _registros[:len(_registros) - MAX_REGISTROS]
+
+def registros():
+    return list(_registros)
+
+def extrair_registros(inicio=0):
+    """Remove e devolve os registros a partir da posição `inicio` (ex.: os de uma tarefa de worker)."""
+    regs = _registros[inicio:]
+    del _registros[inicio:]
+    return regs
+
+def incorporar(regs):
+    """
+    Acrescenta registros de etapas executadas em outros processos (ex.: workers
+    de meraki_shards) ao resumo, aninhados na etapa em andamento. Não são
+    reemitidos no log: cada processo já grava os seus.
+    """
+    for reg in regs:
+        reg = dict(reg)
+        reg["nivel"] = reg.get("nivel", 0) + len(_pilha)
+        _guardar(reg)
+
+def resumo_execucao(imprimir=True):
+    """
+    Tabela de fim de execução (uma linha por etapa, na ordem de execução).
+    Os registros resumidos são descartados: o próximo resumo só traz as etapas
+    executadas depois deste.
+    """
+    colunas = ["etapa", "tempo_s", "cpu_s", "rss_pico_mb", "linhas_entrada",
+               "linhas_saida", "bytes_s3", "cache_hits"]
+
+    def fmt(v):
+        if v is None:
+            return ""
+        return f"{v:.3f}" if isinstance(v, float) else str(v)
+
+    regs = extrair_registros()
+    linhas = [[fmt(r.get(c)) for c in colunas] for r in regs]
+    total = sum(r.get("tempo_s", 0) for r in regs if r.get("nivel") == 0)
+    evento("resumo", etapas=len(regs), tempo_total_s=round(total, 6))
+    if not imprimir:
+        return linhas
+
+    larg = [max([len(c)] + [len(ln[i]) for ln in linhas]) for i, c in enumerate(colunas)]
+    print(" " + " | ".join(c.ljust(w) for c, w in zip(colunas, larg)))
+    print(" " + "-+-".join("-" * w for w in larg))
+    for ln in linhas:
+        print(" " + " | ".join([ln[0].ljust(larg[0])] + [v.rjust(w) for v, w in zip(ln[1:], larg[1:])]))
+    print(f" Total: {total:.3f}s em {len(regs)} etapas")
+    return linhas
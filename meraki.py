@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Meraki Match – linha de comando unificada.
+
+    python meraki.py etl        [--dados-dir PASTA] [--pre-carregar MB]
+    python meraki.py cluster    [--ks 3,4,5,6] [--amostra-silhouette N] [--particionar-por DS_SEGMENTO | --drift]
+    python meraki.py shard      particionar --por COLUNA | treinar [--shard ID] | mesclar
+    python meraki.py recommend  [--modo cluster|vizinhos] [--k-vizinhos K] [--gzip] [--delta]
+    python meraki.py visuals    [--topn N] [--planilha-clientes] [--upload --bucket B | --destino-local PASTA]
+    python meraki.py serve      [--porta 8000] [--recomendacoes ARQUIVO]
+
+Este módulo só importa a biblioteca padrão: pandas, scikit-learn, matplotlib e
+boto3 são carregados dentro do subcomando que precisa deles, para que `--help`
+e os subcomandos leves iniciem rápido.
+"""
+
+import os
+import sys
+import argparse
+
+
+# ==============================
+# Subcomandos
+# ==============================
+def cmd_etl(args):
+    if args.dados_dir:
+        os.environ["MERAKI_DADOS_DIR"] = args.dados_dir
+    import etl_s3_totvs as etl
+    from instrumentacao import resumo_execucao
+    if args.pre_carregar:
+        etl.ler_fontes(args.pre_carregar)
+    etl.tratar_nps()
+    etl.tratar_tickets()
+    etl.tratar_vendas()
+    etl.tratar_clientes()
+    etl.tratar_telemetria()
+    etl.construir_base_analitica()
+    etl.gravar_relatorio()
+    print(" ETL finalizado.")
+    resumo_execucao()
+
+def cmd_cluster(args):
+    import meraki_cluster_recomendacao as mcr
+    from instrumentacao import resumo_execucao
+    ks = [int(k) for k in args.ks.split(",") if k.strip()]
+    mcr.executar_clusterizacao(ks=ks, amostra_silhouette=args.amostra_silhouette,
+                               particionar_por=args.particionar_por, pasta_shards=args.pasta_shards,
+                               processos=args.processos, drift=args.drift,
+                               forcar_retreino=args.forcar_retreino)
+    print(" Clusterização concluída.")
+    resumo_execucao()
+
+def cmd_shard(args):
+    import meraki_shards as ms
+    from instrumentacao import resumo_execucao
+    if args.acao == "particionar":
+        import meraki_cluster_recomendacao as mcr
+        if not args.por:
+            raise SystemExit("shard particionar: informe --por COLUNA.")
+        ks = [int(k) for k in args.ks.split(",") if k.strip()]
+        ms.particionar(mcr.carregar_ou_construir_base(), args.por, args.pasta_shards,
+                       ks=ks, amostra_silhouette=args.amostra_silhouette)
+    elif args.acao == "treinar":
+        if args.shard:
+            for sid in args.shard:
+                ms.treinar_shard(args.pasta_shards, sid, forcar=args.forcar)
+        elif ms.treinar_pendentes(args.pasta_shards, processos=args.processos):
+            raise SystemExit(1)
+    else:
+        import meraki_cluster_recomendacao as mcr
+        manifesto = ms.ler_manifesto(args.pasta_shards)
+        if manifesto is None:
+            raise SystemExit(f"Manifesto não encontrado em {args.pasta_shards}.")
+        mcr.executar_clusterizacao(ks=manifesto["ks"], amostra_silhouette=manifesto["amostra_silhouette"],
+                                   particionar_por=manifesto["coluna"], pasta_shards=args.pasta_shards,
+                                   treinar_shards=False)
+    resumo_execucao()
+
+def cmd_recommend(args):
+    import meraki_cluster_recomendacao as mcr
+    from instrumentacao import resumo_execucao
+    mcr.executar_recomendacao(modo=args.modo, k_vizinhos=args.k_vizinhos,
+                              benchmark_vizinhos=args.benchmark_vizinhos,
+                              saida_clientes=mcr.saida_recomendacoes(args.gzip), delta=args.delta)
+    print(" Recomendações concluídas.")
+    resumo_execucao()
+
+def cmd_visuals(args):
+    import visual
+    argv = ["--topn", str(args.topn), "--prefix", args.prefix]
+    if args.upload:
+        argv += ["--upload", "--bucket", args.bucket]
+    if args.destino_local:
+        argv += ["--destino-local", args.destino_local]
+    if args.planilha_clientes:
+        argv += ["--planilha-clientes"]
+    visual.extras()
+    visual.main(argv)
+
+def cmd_serve(args):
+    from servidor_meraki import servir
+    servir(host=args.host, porta=args.porta, similares=args.similares, recs_csv=args.recomendacoes)
+
+
+# ==============================
+# Parser
+# ==============================
+def criar_parser():
+    p = argparse.ArgumentParser(prog="meraki", description="Meraki Match – pipeline de clusterização e recomendação")
+    p.add_argument("--log-json", default=None, metavar="ARQ",
+                   help="Grava os registros das etapas em JSON lines neste arquivo ('-' = stderr)")
+    sub = p.add_subparsers(dest="comando", metavar="{etl,cluster,shard,recommend,visuals,serve}")
+    sub.required = True
+
+    s = sub.add_parser("etl", help="Lê as fontes (S3 ou pasta local) e gera a base analítica")
+    s.add_argument("--dados-dir", default="", help="Lê os arquivos brutos desta pasta em vez do S3")
+    s.add_argument("--pre-carregar", type=float, default=0, metavar="MB",
+                   help="Baixa antes as fontes que somam até MB brutos, sobrepondo os downloads entre "
+                        "os blocos (padrão: 0 = cada bloco lê as suas)")
+    s.set_defaults(func=cmd_etl)
+
+    s = sub.add_parser("cluster", help="Treina o K-Means e grava clusters_clientes.csv / cluster_summary.xlsx")
+    s.add_argument("--ks", default="3,4,5,6", help="Valores de k testados (padrão: 3,4,5,6)")
+    s.add_argument("--amostra-silhouette", type=int, default=None,
+                   help="Calcula o silhouette numa amostra de N clientes (bases grandes)")
+    s.add_argument("--particionar-por", default="",
+                   help="Treina um K-Means por valor desta coluna (ex.: DS_SEGMENTO), em paralelo")
+    s.add_argument("--pasta-shards", default="shards",
+                   help="Armazenamento compartilhado dos shards: pasta ou s3://bucket/prefixo (padrão: shards)")
+    s.add_argument("--processos", type=int, default=None,
+                   help="Processos para treinar os shards (padrão: nº de CPUs)")
+    s.add_argument("--drift", action="store_true",
+                   help="Só retreina se a base mudou além dos limites (PSI/KS) desde o modelo guardado")
+    s.add_argument("--forcar-retreino", action="store_true",
+                   help="Com --drift, retreina mesmo abaixo dos limites (mantendo os IDs por casamento)")
+    s.set_defaults(func=cmd_cluster)
+
+    s = sub.add_parser("shard", help="Etapas da clusterização particionada, para rodar em várias máquinas")
+    s.add_argument("acao", choices=["particionar", "treinar", "mesclar"])
+    s.add_argument("--por", default="", help="Coluna de partição (particionar)")
+    s.add_argument("--ks", default="3,4,5,6", help="Valores de k testados em cada shard (particionar)")
+    s.add_argument("--amostra-silhouette", type=int, default=None,
+                   help="Silhouette numa amostra de N clientes por shard (particionar)")
+    s.add_argument("--shard", action="append", default=[],
+                   help="Treina só este shard (pode repetir); senão, todos os pendentes")
+    s.add_argument("--forcar", action="store_true", help="Retreina o shard mesmo se já concluído")
+    s.add_argument("--processos", type=int, default=None, help="Processos para treinar (padrão: nº de CPUs)")
+    s.add_argument("--pasta-shards", default="shards",
+                   help="Armazenamento compartilhado dos shards: pasta ou s3://bucket/prefixo (padrão: shards)")
+    s.set_defaults(func=cmd_shard)
+
+    s = sub.add_parser("recommend", help="Gera as recomendações por cliente e por cluster")
+    s.add_argument("--modo", choices=["cluster", "vizinhos"], default="cluster",
+                   help="Estratégia de recomendação (padrão: cluster)")
+    s.add_argument("--k-vizinhos", type=int, default=20, help="Vizinhos usados no modo 'vizinhos' (padrão=20)")
+    s.add_argument("--benchmark-vizinhos", action="store_true",
+                   help="Mede recall x latência do índice de vizinhos contra força bruta")
+    s.add_argument("--gzip", action="store_true",
+                   help="Grava recomendacoes_por_cliente.csv.gz (comprimido) em vez do CSV")
+    s.add_argument("--delta", action="store_true",
+                   help="Recalcula só os clientes que mudaram desde a última execução e grava recomendacoes_delta.csv")
+    s.set_defaults(func=cmd_recommend)
+
+    s = sub.add_parser("visuals", help="Gera gráficos, planilhas e rótulos; publica opcionalmente")
+    s.add_argument("--topn", type=int, default=8, help="Qtde de features com maior variância para o gráfico (padrão=8)")
+    s.add_argument("--upload", action="store_true", help="Faz upload dos artefatos para S3")
+    s.add_argument("--bucket", default="", help="Bucket S3 (necessário se --upload)")
+    s.add_argument("--prefix", default="outputs/", help="Prefixo/pasta no S3 (padrão: outputs/)")
+    s.add_argument("--destino-local", default="", help="Publica os artefatos nesta pasta em vez do S3")
+    s.add_argument("--planilha-clientes", action="store_true",
+                   help="Exporta também recomendacoes_por_cliente.xlsx (streaming, dividida em abas)")
+    s.set_defaults(func=cmd_visuals)
+
+    s = sub.add_parser("serve", help="API HTTP de consulta de recomendações e clientes semelhantes")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--porta", type=int, default=8000)
+    s.add_argument("--similares", action="store_true",
+                   help="Constrói o índice de clientes semelhantes na inicialização (senão, na 1ª consulta)")
+    s.add_argument("--recomendacoes", default="recomendacoes_por_cliente.csv",
+                   help="CSV de recomendações servido; usa a variante .csv.gz se for a mais recente")
+    s.set_defaults(func=cmd_serve)
+    return p
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    if args.log_json is not None:
+        os.environ["MERAKI_LOG_JSON"] = args.log_json
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
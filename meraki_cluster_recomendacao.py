@@ -1,10 +1,10 @@
 import os
 import pandas as pd
 import numpy as np
-from datetime import datetime
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+
+from instrumentacao import etapa, evento, registrar, resumo_execucao
+from perfil_clusters import COLS_CATEGORICAS, perfilar_clusters, tabelas_resumo
+from relatorios import TAMANHO_LOTE, EscritorCSV, RelatorioXLSX
 
 def _to_numeric_br(series: pd.Series) -> pd.Series:
     # remove espaços, remove separador de milhar ".", troca vírgula por ponto
@@ -17,10 +17,12 @@ def _to_numeric_br(series: pd.Series) -> pd.Series:
 # ==============================
 # 1) CARREGAR/RECONSTRUIR BASE
 # ==============================
+@etapa
 def carregar_ou_construir_base():
     base_path = "base_analitica_meraki.csv"
     if os.path.exists(base_path):
         print(" Lendo base_analitica_meraki.csv")
+        registrar("cache_hits")
         return pd.read_csv(base_path)
 
     print(" base_analitica_meraki.csv não encontrada. Reconstruindo a partir dos tratados...")
@@ -78,19 +80,31 @@ def carregar_ou_construir_base():
     print(" base_analitica_meraki.csv gerada.")
     return base
 
+def data_referencia(datas: pd.Series) -> pd.Timestamp:
+    """Data até a qual ANTIGUIDADE_MESES é medida: o contrato mais recente (sem nenhum, hoje)."""
+    referencia = datas.max()
+    return pd.Timestamp.today() if pd.isna(referencia) else referencia
+
+def antiguidade_meses(datas: pd.Series, referencia) -> pd.Series:
+    return ((referencia - datas).dt.days / 30.44).round(1)
+
 # =================================
 # 2) FEATURE ENGINEERING & LIMPEZA
 # =================================
+@etapa
 def preparar_features(base: pd.DataFrame):
     df = base.copy()
 
-    # Antiguidade (meses) a partir de DT_ASSINATURA_CONTRATO (se existir)
+    # Antiguidade (meses) a partir de DT_ASSINATURA_CONTRATO (se existir), medida
+    # até o contrato mais recente da base e não até hoje: a mesma base gera as
+    # mesmas features em qualquer data (o modelo de drift guarda essa data e a
+    # reaproveita na atribuição incremental: meraki_drift.com_referencia_do_modelo)
     if "DT_ASSINATURA_CONTRATO" in df.columns:
         df["DT_ASSINATURA_CONTRATO"] = pd.to_datetime(
             df["DT_ASSINATURA_CONTRATO"], errors="coerce", dayfirst=True
         )
-        hoje = pd.Timestamp.today()
-        df["ANTIGUIDADE_MESES"] = ((hoje - df["DT_ASSINATURA_CONTRATO"]).dt.days / 30.44).round(1)
+        df["ANTIGUIDADE_MESES"] = antiguidade_meses(df["DT_ASSINATURA_CONTRATO"],
+                                                    data_referencia(df["DT_ASSINATURA_CONTRATO"]))
     else:
         df["ANTIGUIDADE_MESES"] = np.nan
 
@@ -107,7 +121,7 @@ def preparar_features(base: pd.DataFrame):
 
     # Converte todas as features numéricas de formato BR -> float
     for c in features_num:
-        df[c] = _to_numeric_br(df[c]) if df[c].dtype == "O" else pd.to_numeric(df[c], errors="coerce")
+        df[c] = _to_numeric_br(df[c]) if not pd.api.types.is_numeric_dtype(df[c]) else pd.to_numeric(df[c], errors="coerce")
 
     # Completa faltantes com a mediana
     for c in features_num:
@@ -140,13 +154,24 @@ def preparar_features(base: pd.DataFrame):
 # ======================================
 # 3) ESCOLHA DO k (SILHOUETTE) + KMEANS
 # ======================================
-def treinar_kmeans(X_scaled, ks=[3,4,5,6], random_state=42):
+@etapa
+def treinar_kmeans(X_scaled, ks=[3,4,5,6], random_state=42, amostra_silhouette=None):
+    """
+    amostra_silhouette: se informado, calcula o silhouette numa amostra de
+    clientes (o cálculo exato é O(n²) e inviável em bases grandes).
+    """
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
     best_k, best_score, best_model = None, -1, None
+    if amostra_silhouette is not None and amostra_silhouette >= len(X_scaled):
+        amostra_silhouette = None
     for k in ks:
         km = KMeans(n_clusters=k, random_state=random_state, n_init="auto")
         labels = km.fit_predict(X_scaled)
-        score = silhouette_score(X_scaled, labels)
+        score = silhouette_score(X_scaled, labels, sample_size=amostra_silhouette, random_state=random_state)
         print(f"k={k} | silhouette={score:.4f}")
+        evento("silhouette", k=k, score=round(float(score), 6))
         if score > best_score:
             best_k, best_score, best_model = k, score, km
     print(f" Melhor k={best_k} (silhouette={best_score:.4f})")
@@ -155,6 +180,7 @@ def treinar_kmeans(X_scaled, ks=[3,4,5,6], random_state=42):
 # ======================================
 # 4) PERFIL DE CLUSTER + SALVAMENTOS
 # ======================================
+@etapa
 def salvar_resultados(df, X, labels, feature_names):
     """
     df: dataframe original (com CD_CLIENTE e colunas de negócio)
@@ -170,30 +196,25 @@ def salvar_resultados(df, X, labels, feature_names):
 
     # 2) Construir DF de features (garantir DataFrame mesmo se X for ndarray)
     if isinstance(X, pd.DataFrame):
-        feats_df = X.copy()
+        feats_df = X.astype(float)
     else:
-        feats_df = pd.DataFrame(X, columns=feature_names)
+        feats_df = pd.DataFrame(X, columns=feature_names).astype(float)
+    num_cols = list(feats_df.columns)
 
+    # categorias de negócio do df original, para a composição dos clusters
+    cat_cols = [c for c in COLS_CATEGORICAS if c in df.columns]
+    for c in cat_cols:
+        feats_df[c] = df[c].to_numpy()
     feats_df["cluster"] = labels
 
-    # 3) Perfil numérico dos clusters (médias das features)
-    perfil = feats_df.groupby("cluster").mean(numeric_only=True).reset_index()
+    # 3) Perfil completo dos clusters (médias, quantis, composição, MRR) num único motor
+    perfil = perfilar_clusters(feats_df, num_cols=num_cols, cat_cols=cat_cols)
 
-    # 4) Contagem por segmento no df original (opcional)
-    seg_count = pd.DataFrame()
-    if "DS_SEGMENTO" in df.columns:
-        df_seg = df.copy()
-        df_seg["cluster"] = labels
-        seg_count = (df_seg.groupby(["cluster", "DS_SEGMENTO"])["CD_CLIENTE"]
-                          .count()
-                          .reset_index()
-                          .rename(columns={"CD_CLIENTE": "QTD"}))
-
-    # 5) Salvar resumo em Excel
-    with pd.ExcelWriter("cluster_summary.xlsx", engine="xlsxwriter") as xlw:
-        perfil.to_excel(xlw, index=False, sheet_name="metricas_medias")
-        if not seg_count.empty:
-            seg_count.to_excel(xlw, index=False, sheet_name="segmento_contagem")
+    # 4) Salvar resumo em Excel (metricas_medias, segmento_contagem, tamanho, quantis, ...)
+    with RelatorioXLSX("cluster_summary.xlsx") as rel:
+        for aba, tabela in tabelas_resumo(perfil).items():
+            if not tabela.empty:
+                rel.escrever(aba, tabela)
 
     print(" cluster_summary.xlsx salvo.")
 
@@ -201,13 +222,31 @@ def salvar_resultados(df, X, labels, feature_names):
 # ======================================
 # 5) RECOMENDAÇÃO: TOP PRODUTOS POR CLUSTER
 # ======================================
-def gerar_recomendacoes(labels):
+@etapa
+def gerar_recomendacoes(labels, modo="cluster", indice=None, k_vizinhos=20,
+                        saida_clientes="recomendacoes_por_cliente.csv", delta=False,
+                        pasta_snapshot="snapshot_recomendacoes"):
     """
     Estratégia simples:
     - Usa clientes_tratado.csv para ver 'DS_PROD' (produto atual)
     - Para cada cluster, encontra os TOP produtos mais comuns
     - Para cada cliente, recomenda TOP-N do cluster que ele ainda não possui
+
+    modo="vizinhos": pontua os produtos dos k_vizinhos clientes mais semelhantes
+    (IndiceIVF de meraki_vizinhos, peso 1/(1+distância)) e completa com o TOP do
+    cluster quando os vizinhos não trazem TOP-N produtos novos.
+
+    As recomendações por cliente são gravadas em lotes em `saida_clientes`
+    (comprimido com gzip se o nome terminar em .gz).
+
+    delta=True: compara com o snapshot da execução anterior (meraki_delta), só
+    recalcula os clientes afetados e grava recomendacoes_delta.csv.
     """
+    if modo not in ("cluster", "vizinhos"):
+        raise ValueError(f"modo de recomendação inválido: {modo}")
+    if modo == "vizinhos" and indice is None:
+        raise ValueError("modo='vizinhos' requer um IndiceIVF construído (indice=...).")
+
     try:
         clientes = pd.read_csv("clientes_tratado.csv", encoding="utf-8")
     except Exception as e:
@@ -255,29 +294,90 @@ def gerar_recomendacoes(labels):
 
     # Para cada cliente, recomendar TOP-N do cluster que ele não possui
     TOP_N = 3
-    recs = []
-    for _, row in clusters.iterrows():
-        cid = row["CD_CLIENTE"]
-        cl  = row["cluster"]
-        ja_tem = prods_cliente.get(cid, set())
+    top_por_cluster = top_produtos.groupby("cluster")["DS_PROD"].apply(list).to_dict()
 
-        top_do_cluster = top_produtos[top_produtos["cluster"] == cl]["DS_PROD"].tolist()
-        sugerir = [p for p in top_do_cluster if p not in ja_tem][:TOP_N]
-        recs.append({"CD_CLIENTE": cid, "cluster": cl, "RECOMENDACOES": ", ".join(map(str, sugerir))})
+    sugestoes_vizinhos = {}
+    if modo == "vizinhos":
+        from meraki_vizinhos import recomendar_por_vizinhos
+        sugestoes_vizinhos = recomendar_por_vizinhos(
+            indice, clientes[["CD_CLIENTE", "DS_PROD"]], k=k_vizinhos, top_n=TOP_N
+        )
 
-    pd.DataFrame(recs).to_csv("recomendacoes_por_cliente.csv", index=False, encoding="utf-8")
-    print(" recomendacoes_por_cliente.csv salvo.")
+    def recomendar(cid, cl):
+        ja_tem = prods_cliente.get(cid, set())
+        sugerir = list(sugestoes_vizinhos.get(cid, []))
+        for p in top_por_cluster.get(cl, []):
+            if len(sugerir) >= TOP_N:
+                break
+            if p not in ja_tem and p not in sugerir:
+                sugerir.append(p)
+        return ", ".join(map(str, sugerir))
+
+    cols_saida = ["CD_CLIENTE", "cluster", "RECOMENDACOES"]
+    if delta:
+        from meraki_delta import recomendar_delta
+
+        def publicar(recs):
+            with EscritorCSV(saida_clientes, cols_saida) as saida:
+                saida.escrever(recs)
+            registrar("linhas_saida", saida.linhas)
+
+        # o snapshot só é atualizado depois que saida_clientes foi gravado
+        recomendar_delta(clusters, prods_cliente, top_por_cluster, recomendar,
+                         top_n=TOP_N, modo=modo, pasta=pasta_snapshot, publicar=publicar)
+    else:
+        # grava em lotes: a memória não cresce com o número de clientes
+        with EscritorCSV(saida_clientes, cols_saida) as saida:
+            lote = []
+            for cid, cl in zip(clusters["CD_CLIENTE"], clusters["cluster"]):
+                lote.append((cid, cl, recomendar(cid, cl)))
+                if len(lote) >= TAMANHO_LOTE:
+                    saida.escrever(lote)
+                    lote = []
+            saida.escrever(lote)
+        registrar("linhas_saida", saida.linhas)
+    print(f" {saida_clientes} salvo.")
 
 # ==============================
 # MAIN
 # ==============================
-if __name__ == "__main__":
+def saida_recomendacoes(comprimir=False):
+    return "recomendacoes_por_cliente.csv.gz" if comprimir else "recomendacoes_por_cliente.csv"
+
+def executar_clusterizacao(ks=(3, 4, 5, 6), amostra_silhouette=None, particionar_por=None,
+                           pasta_shards="shards", processos=None, treinar_shards=True,
+                           drift=False, forcar_retreino=False):
+    """
+    Base -> features -> KMeans (k por silhouette) -> clusters_clientes.csv + cluster_summary.xlsx.
+
+    particionar_por: treina um K-Means por valor desta coluna (ex.: DS_SEGMENTO) em
+    processos paralelos, via meraki_shards, e usa os IDs de cluster globais da
+    mesclagem. pasta_shards pode ser uma pasta compartilhada ou s3://bucket/prefixo;
+    treinar_shards=False só mescla shards já treinados (ex.: em outras máquinas).
+
+    drift: compara a base com o modelo guardado (meraki_drift) e só retreina se
+    o drift passar dos limites; senão apenas atribui aos centróides existentes.
+    """
+    if drift and particionar_por:
+        raise ValueError("drift e particionar_por não podem ser usados juntos.")
     base = carregar_ou_construir_base()
     df, X, X_scaled, feat_names = preparar_features(base)
 
-    # Treinar KMeans (k selecionado por silhouette)
-    modelo = treinar_kmeans(X_scaled, ks=[3,4,5,6], random_state=42)
-    labels = modelo.predict(X_scaled)
+    if particionar_por:
+        from meraki_shards import clusterizar_por_shards
+        labels = clusterizar_por_shards(base, particionar_por, pasta_shards, ks=list(ks),
+                                        amostra_silhouette=amostra_silhouette,
+                                        processos=processos, treinar=treinar_shards)
+    elif drift:
+        from meraki_drift import clusterizar_com_drift
+        labels = clusterizar_com_drift(
+            df, X, X_scaled,
+            lambda Xs: treinar_kmeans(Xs, ks=list(ks), random_state=42, amostra_silhouette=amostra_silhouette),
+            forcar_retreino=forcar_retreino)
+    else:
+        # Treinar KMeans (k selecionado por silhouette)
+        modelo = treinar_kmeans(X_scaled, ks=list(ks), random_state=42, amostra_silhouette=amostra_silhouette)
+        labels = modelo.predict(X_scaled)
 
     # Salvar clusters e resumo
     # X aqui é DataFrame; feat_names é apenas informativo
@@ -287,8 +387,52 @@ if __name__ == "__main__":
         # caso raro, mas garantimos uma estrutura DataFrame
         X_df = pd.DataFrame(X, columns=feat_names)
         salvar_resultados(df, X_df, labels, feat_names)
+    return df, X_scaled, labels
 
-    # Recomendações
-    gerar_recomendacoes(labels)
+def executar_recomendacao(labels=None, modo="cluster", k_vizinhos=20, benchmark_vizinhos=False,
+                          df=None, X_scaled=None, saida_clientes="recomendacoes_por_cliente.csv",
+                          delta=False):
+    """
+    Gera as recomendações a partir de clusters_clientes.csv. O índice de vizinhos
+    (modo 'vizinhos' / benchmark) usa X_scaled; se não for passado, é recalculado da base.
+    """
+    indice = None
+    if modo == "vizinhos" or benchmark_vizinhos:
+        from meraki_vizinhos import IndiceIVF, benchmark_recall_latencia
+        if X_scaled is None:
+            df, _, X_scaled, _ = preparar_features(carregar_ou_construir_base())
+        indice = IndiceIVF().construir(X_scaled, df["CD_CLIENTE"].values)
+        if benchmark_vizinhos:
+            benchmark_recall_latencia(X_scaled, df["CD_CLIENTE"].values).to_csv(
+                "benchmark_vizinhos.csv", index=False, encoding="utf-8")
+            print(" benchmark_vizinhos.csv salvo.")
+
+    gerar_recomendacoes(labels, modo=modo, indice=indice, k_vizinhos=k_vizinhos,
+                        saida_clientes=saida_clientes, delta=delta)
+
+def parse_args(argv=None):
+    import argparse
+    p = argparse.ArgumentParser(description="Meraki Match – Clusterização + Recomendações")
+    p.add_argument("--modo", choices=["cluster", "vizinhos"], default="cluster",
+                   help="Estratégia de recomendação (padrão: cluster)")
+    p.add_argument("--k-vizinhos", type=int, default=20, help="Vizinhos usados no modo 'vizinhos' (padrão=20)")
+    p.add_argument("--benchmark-vizinhos", action="store_true",
+                   help="Mede recall x latência do índice de vizinhos contra força bruta")
+    p.add_argument("--gzip", action="store_true",
+                   help="Grava recomendacoes_por_cliente.csv.gz (comprimido) em vez do CSV")
+    p.add_argument("--delta", action="store_true",
+                   help="Recalcula só os clientes que mudaram desde a última execução e grava recomendacoes_delta.csv")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    df, X_scaled, labels = executar_clusterizacao()
+    executar_recomendacao(labels, modo=args.modo, k_vizinhos=args.k_vizinhos,
+                          benchmark_vizinhos=args.benchmark_vizinhos, df=df, X_scaled=X_scaled,
+                          saida_clientes=saida_recomendacoes(args.gzip), delta=args.delta)
 
     print(" Pipeline de clusterização + recomendações concluído.")
+    resumo_execucao()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Recomendações incrementais (modo delta).
+
+A cada execução o estado por cliente (cluster, hash do conjunto de produtos,
+recomendações publicadas) e o ranking de produtos de cada cluster ficam
+gravados em uma pasta de snapshot. Na execução seguinte só são recalculados os
+clientes afetados:
+
+    NOVO      cliente sem estado anterior
+    CLUSTER   cliente mudou de cluster
+    PRODUTOS  conjunto de produtos do cliente mudou
+    RANKING   o ranking do cluster mudou dentro do trecho que o cliente percorre
+              (as primeiras TOP_N + qtd. de produtos do cliente posições)
+
+Os demais reaproveitam as recomendações do snapshot. Só as linhas cujo
+resultado publicado mudou (cluster ou recomendações), além de novos e
+removidos, vão para o arquivo delta consumido pelas integrações (CRM).
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+PASTA_SNAPSHOT = "snapshot_recomendacoes"
+ARQ_CLIENTES = "clientes.csv.gz"
+ARQ_RANKINGS = "rankings.csv.gz"
+ARQ_META = "meta.json"
+
+
+# ==============================
+# 1) ESTADO ATUAL
+# ==============================
+def hash_produtos(produtos):
+    """Impressão digital de um conjunto de produtos (independe da ordem)."""
+    chave = "\x1f".join(sorted(map(str, produtos)))
+    return hashlib.blake2b(chave.encode("utf-8"), digest_size=8).hexdigest()
+
+def estado_clientes(clusters, prods_cliente):
+    """
+    clusters: DataFrame CD_CLIENTE, cluster (clusters_clientes.csv)
+    prods_cliente: {CD_CLIENTE: set de produtos atuais}
+    Retorna CD_CLIENTE, cluster, HASH_PRODUTOS, QTD_PRODUTOS.
+    """
+    estado = clusters[["CD_CLIENTE", "cluster"]].copy()
+    hashes = {cid: hash_produtos(p) for cid, p in prods_cliente.items()}
+    qtds = {cid: len(p) for cid, p in prods_cliente.items()}
+    estado["HASH_PRODUTOS"] = estado["CD_CLIENTE"].map(hashes).fillna(hash_produtos(()))
+    estado["QTD_PRODUTOS"] = estado["CD_CLIENTE"].map(qtds).fillna(0).astype(int)
+    return estado
+
+
+# ==============================
+# 2) SNAPSHOT
+# ==============================
+def carregar_snapshot(pasta=PASTA_SNAPSHOT):
+    """Retorna {"meta", "clientes", "rankings"} da execução anterior, ou None."""
+    caminho_meta = os.path.join(pasta, ARQ_META)
+    if not os.path.exists(caminho_meta):
+        return None
+    with open(caminho_meta, encoding="utf-8") as f:
+        meta = json.load(f)
+    clientes = pd.read_csv(os.path.join(pasta, ARQ_CLIENTES), encoding="utf-8")
+    clientes["RECOMENDACOES"] = clientes["RECOMENDACOES"].fillna("")
+    rk = pd.read_csv(os.path.join(pasta, ARQ_RANKINGS), encoding="utf-8")
+    rankings = rk.groupby("cluster", sort=False)["DS_PROD"].apply(list).to_dict()
+    return {"meta": meta, "clientes": clientes, "rankings": rankings}
+
+def salvar_snapshot(clientes, rankings, meta, pasta=PASTA_SNAPSHOT):
+    """
+    clientes: CD_CLIENTE, cluster, HASH_PRODUTOS, QTD_PRODUTOS, RECOMENDACOES
+    rankings: {cluster: [DS_PROD em ordem]}
+    Cada arquivo é gravado em .tmp e renomeado; meta.json por último, de modo
+    que uma execução interrompida não deixa um snapshot parcial como válido.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    rk = pd.DataFrame([(cl, p) for cl, lista in rankings.items() for p in lista],
+                      columns=["cluster", "DS_PROD"])
+    for nome, df in ((ARQ_CLIENTES, clientes), (ARQ_RANKINGS, rk)):
+        destino = os.path.join(pasta, nome)
+        df.to_csv(destino + ".tmp", index=False, encoding="utf-8", compression="gzip")
+        os.replace(destino + ".tmp", destino)
+    destino = os.path.join(pasta, ARQ_META)
+    with open(destino + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(destino + ".tmp", destino)
+
+
+# ==============================
+# 3) DIFERENÇAS
+# ==============================
+def primeira_diferenca(rankings, rankings_anteriores):
+    """
+    {cluster: posição da 1ª diferença entre o ranking atual e o anterior}.
+    Clusters com ranking idêntico ficam de fora; clusters novos valem 0.
+    """
+    dif = {}
+    for cl, atual in rankings.items():
+        anterior = rankings_anteriores.get(cl)
+        if anterior is None:
+            dif[cl] = 0
+            continue
+        if atual == anterior:
+            continue
+        dif[cl] = next((i for i, (a, b) in enumerate(zip(atual, anterior)) if a != b),
+                       min(len(atual), len(anterior)))
+    return dif
+
+def comparar_estados(estado, anterior, dif_ranking, top_n):
+    """
+    Junta o estado atual ao anterior e classifica cada cliente (coluna MOTIVO,
+    vazia quando o cliente não precisa ser recalculado). Retorna (estado com
+    cluster_ANT/RECOMENDACOES_ANT/MOTIVO, DataFrame dos clientes removidos).
+    """
+    ant = anterior[["CD_CLIENTE", "cluster", "HASH_PRODUTOS", "RECOMENDACOES"]].rename(
+        columns={"cluster": "cluster_ANT", "HASH_PRODUTOS": "HASH_ANT", "RECOMENDACOES": "RECOMENDACOES_ANT"})
+    m = estado.merge(ant, on="CD_CLIENTE", how="left", indicator="_origem")
+
+    novo = (m["_origem"] == "left_only").to_numpy()
+    pos = m["cluster"].map(dif_ranking).astype(float).fillna(np.inf).to_numpy()
+    motivo = np.select(
+        [novo,
+         (m["cluster"] != m["cluster_ANT"]).to_numpy(),
+         (m["HASH_PRODUTOS"] != m["HASH_ANT"]).to_numpy(),
+         pos < top_n + m["QTD_PRODUTOS"].to_numpy()],
+        ["NOVO", "CLUSTER", "PRODUTOS", "RANKING"],
+        "",
+    )
+    m["MOTIVO"] = motivo
+    removidos = anterior[~anterior["CD_CLIENTE"].isin(estado["CD_CLIENTE"])]
+    return m.drop(columns=["HASH_ANT", "_origem"]), removidos
+
+
+# ==============================
+# 4) EXECUÇÃO INCREMENTAL
+# ==============================
+def recomendar_delta(clusters, prods_cliente, top_por_cluster, recomendar, top_n=3,
+                     modo="cluster", pasta=PASTA_SNAPSHOT, saida_delta="recomendacoes_delta.csv",
+                     publicar=None):
+    """
+    clusters: DataFrame CD_CLIENTE, cluster
+    prods_cliente: {CD_CLIENTE: set de produtos}
+    top_por_cluster: {cluster: [DS_PROD em ordem de popularidade]}
+    recomendar: função (cd_cliente, cluster) -> texto das recomendações
+    publicar: função (DataFrame completo) que grava as saídas completas
+              (ex.: recomendacoes_por_cliente.csv)
+
+    Recalcula só os clientes afetados e grava `saida_delta`, `publicar` e o
+    snapshot nessa ordem: o delta é gravado em .tmp e só é promovido depois de
+    `publicar`, e o snapshot só é atualizado no fim. Se alguma gravação falhar,
+    o snapshot anterior continua valendo e a próxima execução refaz o delta.
+    No modo 'vizinhos' as sugestões dependem das features de outros clientes, então
+    todos são recalculados; o delta continua contendo só o que mudou.
+    Retorna (DataFrame completo CD_CLIENTE, cluster, RECOMENDACOES; resumo das contagens).
+    """
+    estado = estado_clientes(clusters, prods_cliente)
+    anterior = carregar_snapshot(pasta)
+    # reaproveitamento só vale para o modo cluster com os mesmos parâmetros
+    compativel = (anterior is not None and modo == "cluster"
+                  and anterior["meta"].get("modo") == modo
+                  and anterior["meta"].get("top_n") == top_n)
+
+    if anterior is None:
+        ant_clientes = pd.DataFrame(columns=["CD_CLIENTE", "cluster", "HASH_PRODUTOS", "RECOMENDACOES"])
+        ant_clientes = ant_clientes.astype({"CD_CLIENTE": estado["CD_CLIENTE"].dtype,
+                                            "cluster": estado["cluster"].dtype})
+    else:
+        ant_clientes = anterior["clientes"]
+    dif = primeira_diferenca(top_por_cluster, anterior["rankings"]) if compativel else {}
+    m, removidos = comparar_estados(estado, ant_clientes, dif, top_n)
+    if not compativel:
+        m.loc[m["MOTIVO"] == "", "MOTIVO"] = "COMPLETO"
+
+    # recalcula só os afetados; os demais mantêm as recomendações do snapshot
+    recalcular = (m["MOTIVO"] != "").to_numpy()
+    recs = m["RECOMENDACOES_ANT"].to_numpy(dtype=object, copy=True)
+    idx = np.nonzero(recalcular)[0]
+    recs[idx] = [recomendar(cid, cl) for cid, cl in
+                 zip(m["CD_CLIENTE"].to_numpy()[idx], m["cluster"].to_numpy()[idx])]
+    m["RECOMENDACOES"] = recs
+
+    # delta: novos, alterados (cluster ou recomendações) e removidos
+    alterado = (m["MOTIVO"] != "NOVO") & ((m["cluster"] != m["cluster_ANT"])
+                                          | (m["RECOMENDACOES"] != m["RECOMENDACOES_ANT"]))
+    m["ACAO"] = np.select([m["MOTIVO"] == "NOVO", alterado], ["NOVO", "ALTERADO"], "")
+    cols = ["CD_CLIENTE", "ACAO", "MOTIVO", "cluster", "RECOMENDACOES"]
+    rem = removidos[["CD_CLIENTE", "cluster"]].assign(ACAO="REMOVIDO", MOTIVO="REMOVIDO", RECOMENDACOES="")
+    delta = pd.concat([m.loc[m["ACAO"] != "", cols], rem[cols]], ignore_index=True)
+    delta.to_csv(saida_delta + ".tmp", index=False, encoding="utf-8")
+    recs_df = m[["CD_CLIENTE", "cluster", "RECOMENDACOES"]]
+    if publicar is not None:
+        try:
+            publicar(recs_df)
+        except BaseException:
+            os.remove(saida_delta + ".tmp")
+            raise
+    os.replace(saida_delta + ".tmp", saida_delta)
+
+    salvar_snapshot(
+        m[["CD_CLIENTE", "cluster", "HASH_PRODUTOS", "QTD_PRODUTOS", "RECOMENDACOES"]],
+        top_por_cluster,
+        {"modo": modo, "top_n": top_n, "clientes": int(len(m)),
+         "gerado_em": datetime.now().isoformat(timespec="seconds")},
+        pasta,
+    )
+
+    contagem = delta["ACAO"].value_counts()
+    resumo = {
+        "recalculados": int(recalcular.sum()),
+        "novos": int(contagem.get("NOVO", 0)),
+        "alterados": int(contagem.get("ALTERADO", 0)),
+        "removidos": int(contagem.get("REMOVIDO", 0)),
+    }
+    print(f" {saida_delta} salvo: {resumo['novos']} novos, {resumo['alterados']} alterados, "
+          f"{resumo['removidos']} removidos ({resumo['recalculados']} de {len(m)} clientes recalculados).")
+    return recs_df, resumo
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Monitor de drift da clusterização.
+
+O modelo treinado (scaler + K-Means + IDs de cluster publicados) é guardado em
+modelo_meraki.joblib junto com as distribuições de referência da base de
+treino. A cada execução a base nova é comparada com essa referência:
+
+    PSI e KS   MRR_12M, NPS_MEDIO, ANTIGUIDADE_MESES
+    PSI        composição por DS_SEGMENTO
+    PSI        taxa de atribuição a cada centróide do modelo guardado
+    NOVAS      fração de clientes com categoria (DS_SEGMENTO, FAT_FAIXA) que
+               não existia no treino; qualquer uma força o retreino, porque o
+               one-hot do modelo não tem como representá-la
+
+Abaixo dos limites, os clientes só são atribuídos aos centróides existentes
+(predict, sem treino). Acima de algum limite, o K-Means é retreinado e os
+clusters novos herdam os IDs dos antigos com maior sobreposição de clientes
+(casamento húngaro), para que os IDs publicados não se embaralhem.
+"""
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from instrumentacao import etapa, evento
+
+CAMINHO_MODELO = "modelo_meraki.joblib"
+COLS_DRIFT = ("MRR_12M", "NPS_MEDIO", "ANTIGUIDADE_MESES")
+COL_SEGMENTO = "DS_SEGMENTO"
+COLS_CATEGORIAS = ("DS_SEGMENTO", "FAT_FAIXA")   # as do one-hot de preparar_features
+COL_DATA = "DT_ASSINATURA_CONTRATO"              # base de ANTIGUIDADE_MESES
+LIMITE_PSI = 0.2     # PSI > 0,2: mudança relevante de distribuição
+LIMITE_KS = 0.15     # estatística D do KS (o p-valor é sempre ~0 em bases grandes)
+N_FAIXAS = 10
+AMOSTRA_KS = 5000
+
+
+# ==============================
+# 1) ESTATÍSTICAS
+# ==============================
+def psi(esperado, observado, eps=1e-4):
+    """Population Stability Index entre duas distribuições de proporções."""
+    p = np.clip(np.asarray(esperado, dtype=float), eps, None)
+    q = np.clip(np.asarray(observado, dtype=float), eps, None)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+def _valores(df, col):
+    v = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+    return v[~np.isnan(v)]
+
+def _mix_segmento(df):
+    return df[COL_SEGMENTO].fillna("SEM_VALOR").astype(str).value_counts(normalize=True)
+
+def referencia(df, centroide, k, random_state=42):
+    """
+    Distribuições de referência da base de treino: cortes por decil e
+    proporções (PSI) + amostra ordenada (KS) de cada coluna monitorada,
+    composição por segmento e proporção de clientes por centróide.
+    """
+    rng = np.random.default_rng(random_state)
+    ref = {"numericas": {}, "segmento": None,
+           "atribuicao": np.bincount(centroide, minlength=k) / max(len(centroide), 1)}
+    for col in COLS_DRIFT:
+        if col not in df.columns:
+            continue
+        v = _valores(df, col)
+        if not len(v):
+            continue
+        cortes = np.unique(np.quantile(v, np.linspace(0, 1, N_FAIXAS + 1)[1:-1]))
+        ref["numericas"][col] = {
+            "cortes": cortes,
+            "proporcoes": np.bincount(np.searchsorted(cortes, v, side="right"), minlength=len(cortes) + 1) / len(v),
+            "amostra": np.sort(rng.choice(v, min(AMOSTRA_KS, len(v)), replace=False)),
+        }
+    if COL_SEGMENTO in df.columns:
+        ref["segmento"] = _mix_segmento(df)
+    return ref
+
+def medir_drift(modelo, df, centroide, limite_psi=LIMITE_PSI, limite_ks=LIMITE_KS):
+    """
+    Compara a base atual (df de preparar_features) e a atribuição dos clientes
+    aos centróides guardados (`centroide`) com a referência do modelo.
+    Retorna DataFrame metrica, variavel, valor, limite, acima.
+    """
+    from scipy.stats import ks_2samp
+
+    ref = modelo["referencia"]
+    linhas = []
+    for col, r in ref["numericas"].items():
+        if col not in df.columns:
+            continue
+        v = _valores(df, col)
+        if not len(v):
+            continue
+        atual = np.bincount(np.searchsorted(r["cortes"], v, side="right"), minlength=len(r["proporcoes"])) / len(v)
+        linhas.append(("PSI", col, psi(r["proporcoes"], atual), limite_psi))
+        linhas.append(("KS", col, float(ks_2samp(r["amostra"], v).statistic), limite_ks))
+
+    if ref["segmento"] is not None and COL_SEGMENTO in df.columns:
+        mix = pd.concat([ref["segmento"], _mix_segmento(df)], axis=1).fillna(0.0)
+        linhas.append(("PSI", "mix_" + COL_SEGMENTO, psi(mix.iloc[:, 0], mix.iloc[:, 1]), limite_psi))
+
+    taxas = np.bincount(centroide, minlength=len(ref["atribuicao"])) / max(len(centroide), 1)
+    linhas.append(("PSI", "atribuicao_centroides", psi(ref["atribuicao"], taxas), limite_psi))
+
+    for col, fracao in categorias_novas(modelo, df).items():
+        linhas.append(("NOVAS", "categorias_" + col, fracao, 0.0))
+
+    rel = pd.DataFrame(linhas, columns=["metrica", "variavel", "valor", "limite"])
+    rel["valor"] = rel["valor"].round(6)
+    rel["acima"] = rel["valor"] > rel["limite"]
+    return rel
+
+
+# ==============================
+# 2) MODELO GUARDADO
+# ==============================
+def carregar_modelo(caminho=CAMINHO_MODELO):
+    if not os.path.exists(caminho):
+        return None
+    import joblib
+    return joblib.load(caminho)
+
+def salvar_modelo(modelo, caminho=CAMINHO_MODELO):
+    import joblib
+    joblib.dump(modelo, caminho + ".tmp")
+    os.replace(caminho + ".tmp", caminho)
+    print(f" {caminho} salvo.")
+
+def niveis_categorias(df):
+    """Níveis de cada coluna categórica, na ordem em que get_dummies os numera."""
+    return {c: sorted(df[c].dropna().unique()) for c in COLS_CATEGORIAS if c in df.columns}
+
+def categorias_novas(modelo, df):
+    """{coluna: fração de linhas com valor fora dos níveis guardados no modelo}."""
+    novas = {}
+    for col, niveis in modelo.get("categorias", {}).items():
+        if col in df.columns and len(df):
+            novas[col] = float((df[col].notna() & ~df[col].isin(niveis)).mean())
+    return novas
+
+def codificar(modelo, df, X):
+    """
+    Features no layout do modelo: numéricas de X e one-hot (drop_first) das
+    categorias com os níveis fixados no treino, para que uma categoria nova ou
+    a ausência da primeira não desloquem as colunas. Valores desconhecidos
+    ficam zerados; medir_drift os conta em NOVAS.
+    """
+    partes = [X]
+    for col, niveis in modelo.get("categorias", {}).items():
+        valores = df[col] if col in df.columns else pd.Series(np.nan, index=df.index)
+        cat = pd.Categorical(valores, categories=niveis)
+        partes.append(pd.get_dummies(pd.Series(cat, index=df.index), prefix=col, drop_first=True))
+    dummies = [f"{c}_{n}" for c, niveis in modelo.get("categorias", {}).items() for n in niveis]
+    Xa = pd.concat([partes[0].drop(columns=dummies, errors="ignore")] + partes[1:], axis=1)
+    return Xa.reindex(columns=modelo["features"], fill_value=0).astype(float)
+
+def com_referencia_do_modelo(modelo, df, X):
+    """
+    df/X com ANTIGUIDADE_MESES medida até a data de referência guardada no
+    modelo, e não até o contrato mais recente da base atual: o scaler guardado
+    é reaproveitado, então um contrato novo não pode deslocar a antiguidade de
+    todos os clientes. Datas faltantes recebem a mediana do treino (a da base
+    atual mudaria com qualquer contrato novo, como a própria referência).
+    """
+    ref = modelo.get("data_referencia")
+    if ref is None or COL_DATA not in df.columns or "ANTIGUIDADE_MESES" not in X.columns:
+        return df, X
+    from meraki_cluster_recomendacao import antiguidade_meses
+    meses = antiguidade_meses(df[COL_DATA], ref).fillna(modelo["mediana_antiguidade"])
+    return df.assign(ANTIGUIDADE_MESES=meses), X.assign(ANTIGUIDADE_MESES=meses)
+
+def atribuir(modelo, df, X):
+    """Índice do centróide do modelo guardado para cada cliente (df/X de preparar_features)."""
+    return modelo["kmeans"].predict(modelo["scaler"].transform(codificar(modelo, df, X)))
+
+def casar_ids(centroide_novo, k_novo, centroide_antigo, ids_antigos, proximo_id):
+    """
+    Casamento húngaro (scipy linear_sum_assignment) entre clusters novos e
+    antigos maximizando os clientes em comum. Clusters novos sem par (ou sem
+    nenhum cliente em comum) recebem IDs inéditos a partir de proximo_id.
+    Retorna (ID publicado de cada cluster novo, próximo ID livre).
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    k_antigo = len(ids_antigos)
+    comum = np.bincount(centroide_novo * k_antigo + centroide_antigo,
+                        minlength=k_novo * k_antigo).reshape(k_novo, k_antigo)
+    linhas, colunas = linear_sum_assignment(comum, maximize=True)
+
+    ids = np.full(k_novo, -1, dtype=int)
+    for i, j in zip(linhas, colunas):
+        if comum[i, j] > 0:
+            ids[i] = ids_antigos[j]
+    for i in np.nonzero(ids < 0)[0]:
+        ids[i] = proximo_id
+        proximo_id += 1
+    return ids, proximo_id
+
+def _novo_modelo(X, X_scaled, kmeans, df, ids, proximo_id):
+    from sklearn.preprocessing import StandardScaler
+    from meraki_cluster_recomendacao import antiguidade_meses, data_referencia
+    centroide = kmeans.predict(X_scaled)
+    # a mesma data e a mesma mediana que preparar_features usou para esta base
+    data_ref = data_referencia(df[COL_DATA]) if COL_DATA in df.columns else None
+    return {
+        "features": list(X.columns),
+        "categorias": niveis_categorias(df),
+        "data_referencia": data_ref,
+        "mediana_antiguidade": antiguidade_meses(df[COL_DATA], data_ref).median() if data_ref is not None else None,
+        "scaler": StandardScaler().fit(X.astype(float)),   # mesmo ajuste de preparar_features
+        "kmeans": kmeans,
+        "ids": np.asarray(ids, dtype=int),
+        "proximo_id": int(proximo_id),
+        "referencia": referencia(df, centroide, kmeans.n_clusters),
+        "linhas": int(len(X)),
+        "treinado_em": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+# ==============================
+# 3) EXECUÇÃO
+# ==============================
+@etapa
+def clusterizar_com_drift(df, X, X_scaled, treinar, caminho_modelo=CAMINHO_MODELO,
+                          limite_psi=LIMITE_PSI, limite_ks=LIMITE_KS, forcar_retreino=False,
+                          saida_relatorio="drift_relatorio.csv"):
+    """
+    df, X, X_scaled: saída de preparar_features
+    treinar: função X_scaled -> KMeans treinado (ex.: treinar_kmeans com os ks escolhidos)
+
+    Sem modelo guardado, treina e guarda. Com modelo, mede o drift (grava
+    `saida_relatorio`); abaixo dos limites apenas atribui os clientes aos
+    centróides existentes, acima retreina e preserva os IDs por casamento.
+    Retorna os IDs de cluster de cada linha.
+    """
+    modelo = carregar_modelo(caminho_modelo)
+    if modelo is None:
+        print(f" {caminho_modelo} não encontrado: treinando o modelo inicial.")
+        kmeans = treinar(X_scaled)
+        modelo = _novo_modelo(X, X_scaled, kmeans, df, np.arange(kmeans.n_clusters), kmeans.n_clusters)
+        salvar_modelo(modelo, caminho_modelo)
+        evento("drift", decisao="treino_inicial")
+        return modelo["ids"][kmeans.predict(X_scaled)]
+
+    df_modelo, X_modelo = com_referencia_do_modelo(modelo, df, X)
+    centroide_antigo = atribuir(modelo, df_modelo, X_modelo)
+    rel = medir_drift(modelo, df_modelo, centroide_antigo, limite_psi=limite_psi, limite_ks=limite_ks)
+    rel.to_csv(saida_relatorio, index=False, encoding="utf-8")
+    for r in rel.itertuples(index=False):
+        print(f" {r.metrica:<5} {r.variavel:<24} {r.valor:8.4f} (limite {r.limite}){'  ⚠️' if r.acima else ''}")
+    print(f" {saida_relatorio} salvo.")
+
+    if not rel["acima"].any() and not forcar_retreino:
+        print(" Drift abaixo dos limites: atribuição incremental aos centróides do modelo guardado.")
+        evento("drift", decisao="incremental", maximo_psi=float(rel.loc[rel.metrica == "PSI", "valor"].max()))
+        return modelo["ids"][centroide_antigo]
+
+    motivo = ", ".join(dict.fromkeys(rel.loc[rel["acima"], "variavel"])) or "retreino forçado"
+    print(f" Retreinando o K-Means ({motivo}).")
+    kmeans = treinar(X_scaled)
+    centroide_novo = kmeans.predict(X_scaled)
+    ids, proximo = casar_ids(centroide_novo, kmeans.n_clusters, centroide_antigo,
+                             modelo["ids"], modelo["proximo_id"])
+    print(" Casamento de IDs (novo -> publicado): " + ", ".join(f"{i}->{c}" for i, c in enumerate(ids)))
+    evento("drift", decisao="retreino", motivo=motivo, ids=[int(c) for c in ids])
+    salvar_modelo(_novo_modelo(X, X_scaled, kmeans, df, ids, proximo), caminho_modelo)
+    return ids[centroide_novo]
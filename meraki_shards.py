@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Clusterização particionada (shards) por segmento ou outra coluna da base.
+
+Cada valor da coluna vira um shard com a sua própria escolha de k (silhouette)
+e o seu próprio K-Means; ao final os rótulos locais são renumerados em IDs de
+cluster globais (shard 0: 0..k0-1, shard 1: k0..k0+k1-1, ...), de modo que
+recomendações e gráficos enxergam clusters comuns.
+
+Tudo passa por um armazenamento compartilhado (pasta local/NFS ou s3://bucket/prefixo):
+
+    manifesto.json                 coluna, parâmetros, impressão digital da base e lista de shards
+    <shard>/entrada.csv.gz         linhas da base daquele shard (+ LINHA_BASE)
+    <shard>/rotulos.csv.gz         LINHA_BASE, cluster_local
+    <shard>/resultado.json         k escolhido; gravado por último = shard concluído
+
+Shards concluídos para a mesma impressão digital são reaproveitados, então uma
+execução interrompida continua de onde parou, e cada shard pode ser treinado em
+outra máquina (`meraki.py shard treinar --shard <id>`) antes do `mesclar`.
+"""
+
+import os
+import io
+import re
+import json
+import socket
+import hashlib
+import unicodedata
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from instrumentacao import etapa, evento, registrar, registros, extrair_registros, incorporar
+
+COL_LINHA = "LINHA_BASE"
+ARQ_MANIFESTO = "manifesto.json"
+
+
+# ==============================
+# Armazenamento compartilhado
+# ==============================
+def abrir_armazenamento(destino):
+    """'s3://bucket/prefixo' -> ArmazenamentoS3; qualquer outro valor -> pasta local."""
+    from armazenamento import ArmazenamentoLocal, ArmazenamentoS3
+    if destino.startswith("s3://"):
+        bucket, _, prefixo = destino[len("s3://"):].partition("/")
+        return ArmazenamentoS3(bucket, prefixo.rstrip("/") + "/" if prefixo else "")
+    return ArmazenamentoLocal(destino)
+
+def _gravar_csv(armaz, nome, df):
+    from armazenamento import executar
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, encoding="utf-8", compression={"method": "gzip", "compresslevel": 6})
+    executar(armaz.gravar(nome, buf.getvalue()))
+
+def _ler_csv(nome, dados):
+    return pd.read_csv(io.BytesIO(dados), encoding="utf-8", compression="gzip")
+
+def _gravar_json(armaz, nome, obj):
+    from armazenamento import executar
+    executar(armaz.gravar(nome, json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")))
+
+def _ler_json(nome, dados):
+    return json.loads(dados.decode("utf-8"))
+
+def _ler_varios(armaz, nomes, parser):
+    from armazenamento import ler_varios, executar
+    lidos = executar(ler_varios(armaz, list(nomes), parser=parser))
+    for nome, res in lidos.items():
+        if isinstance(res, Exception):
+            raise res
+    return {nome: res for nome, (res, _) in lidos.items()}
+
+def ler_manifesto(destino):
+    """Manifesto do armazenamento `destino`, ou None se ainda não foi particionado."""
+    from armazenamento import executar
+    armaz = abrir_armazenamento(destino)
+    if ARQ_MANIFESTO not in executar(armaz.listar(ARQ_MANIFESTO)):
+        return None
+    return _ler_varios(armaz, [ARQ_MANIFESTO], _ler_json)[ARQ_MANIFESTO]
+
+def _concluidos(armaz, manifesto):
+    """{shard: resultado} dos shards concluídos para a impressão digital atual."""
+    from armazenamento import executar
+    existentes = set(executar(armaz.listar()))
+    nomes = [f"{s['id']}/resultado.json" for s in manifesto["shards"]]
+    lidos = _ler_varios(armaz, [n for n in nomes if n in existentes], _ler_json)
+    return {r["shard"]: r for r in lidos.values() if r.get("impressao") == manifesto["impressao"]}
+
+
+# ==============================
+# 1) PARTICIONAR
+# ==============================
+def _slug(valor):
+    texto = unicodedata.normalize("NFKD", str(valor)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^0-9A-Za-z]+", "_", texto).strip("_").upper() or "VAZIO"
+
+def _impressao(base, parametros):
+    """Impressão digital da base + parâmetros; muda => shards antigos são descartados."""
+    h = hashlib.sha1(json.dumps(parametros, sort_keys=True).encode("utf-8"))
+    h.update(str(len(base)).encode())
+    h.update(str(int(pd.util.hash_pandas_object(base, index=False).sum())).encode())
+    return h.hexdigest()[:16]
+
+@etapa
+def particionar(base, coluna, destino="shards", ks=(3, 4, 5, 6), amostra_silhouette=None):
+    """
+    Divide a base por `coluna` (um shard por valor, ausentes em SEM_VALOR) e
+    grava as entradas e o manifesto em `destino`. Se o manifesto já corresponde
+    à mesma base e parâmetros, nada é regravado.
+    """
+    if coluna not in base.columns:
+        raise KeyError(f"Coluna de partição inexistente na base: {coluna}")
+    armaz = abrir_armazenamento(destino)
+    parametros = {"coluna": coluna, "ks": [int(k) for k in ks], "amostra_silhouette": amostra_silhouette}
+    impressao = _impressao(base, parametros)
+
+    atual = ler_manifesto(destino)
+    if atual is not None and atual.get("impressao") == impressao:
+        print(f" Partições de {armaz.uri(ARQ_MANIFESTO)} reaproveitadas ({len(atual['shards'])} shards).")
+        registrar("cache_hits")
+        return atual
+
+    codigos, valores = pd.factorize(base[coluna], sort=True, use_na_sentinel=False)
+    shards = []
+    for i, valor in enumerate(valores):
+        ausente = pd.isna(valor)
+        sid = f"{i:02d}_{'SEM_VALOR' if ausente else _slug(valor)}"
+        pos = np.nonzero(codigos == i)[0]
+        entrada = base.iloc[pos].copy()
+        entrada[COL_LINHA] = pos
+        _gravar_csv(armaz, f"{sid}/entrada.csv.gz", entrada)
+        shards.append({"id": sid, "valor": None if ausente else str(valor), "linhas": int(len(pos))})
+        print(f" shard {sid}: {len(pos)} clientes.")
+
+    manifesto = dict(parametros, impressao=impressao, linhas=int(len(base)), shards=shards,
+                     criado_em=datetime.now().isoformat(timespec="seconds"))
+    _gravar_json(armaz, ARQ_MANIFESTO, manifesto)
+    print(f" {armaz.uri(ARQ_MANIFESTO)} salvo ({len(shards)} shards por {coluna}).")
+    return manifesto
+
+
+# ==============================
+# 2) TREINAR (um shard por processo/máquina)
+# ==============================
+@etapa
+def treinar_shard(destino, shard_id, forcar=False, random_state=42):
+    """
+    Treina o K-Means de um shard (k por silhouette entre os ks do manifesto) e
+    grava rotulos.csv.gz + resultado.json. Shards já concluídos são pulados,
+    a menos que forcar=True.
+    """
+    import meraki_cluster_recomendacao as mcr
+
+    armaz = abrir_armazenamento(destino)
+    manifesto = ler_manifesto(destino)
+    if manifesto is None:
+        raise FileNotFoundError(f"Manifesto não encontrado em {destino}; rode o particionamento antes.")
+    if shard_id not in {s["id"] for s in manifesto["shards"]}:
+        raise KeyError(f"Shard inexistente no manifesto: {shard_id}")
+    feitos = {} if forcar else _concluidos(armaz, manifesto)
+    if shard_id in feitos:
+        print(f" shard {shard_id}: já concluído (skip).")
+        registrar("cache_hits")
+        return feitos[shard_id]
+
+    nome = f"{shard_id}/entrada.csv.gz"
+    entrada = _ler_varios(armaz, [nome], _ler_csv)[nome]
+    linhas = entrada.pop(COL_LINHA).to_numpy()
+    registrar("linhas_entrada", len(entrada))
+
+    ks = [k for k in manifesto["ks"] if 2 <= k < len(entrada)]
+    if ks:
+        _, _, X_scaled, _ = mcr.preparar_features(entrada)
+        modelo = mcr.treinar_kmeans(X_scaled, ks=ks, random_state=random_state,
+                                    amostra_silhouette=manifesto["amostra_silhouette"])
+        rotulos, k = modelo.predict(X_scaled), int(modelo.n_clusters)
+    else:
+        # shard pequeno demais para escolher k: um único cluster
+        rotulos, k = np.zeros(len(entrada), dtype=int), 1
+
+    _gravar_csv(armaz, f"{shard_id}/rotulos.csv.gz", pd.DataFrame({COL_LINHA: linhas, "cluster_local": rotulos}))
+    resultado = {"shard": shard_id, "k": k, "linhas": int(len(entrada)), "impressao": manifesto["impressao"],
+                 "host": socket.gethostname(), "concluido_em": datetime.now().isoformat(timespec="seconds")}
+    _gravar_json(armaz, f"{shard_id}/resultado.json", resultado)
+    print(f" shard {shard_id}: k={k} ({len(entrada)} clientes).")
+    return resultado
+
+def _treinar_em_worker(destino, shard_id, threads):
+    """
+    Entrada dos processos do pool. Limita os pools OpenMP/BLAS a `threads`
+    (threadpoolctl vale mesmo com numpy/sklearn já carregados, ao contrário de
+    OMP_NUM_THREADS & cia.) para que os processos não abram uma thread por núcleo
+    cada um, e devolve os registros de etapa do shard para o resumo do pai
+    (retirando-os do processo, que o pool reaproveita entre shards).
+    """
+    from threadpoolctl import threadpool_limits
+    inicio = len(registros())
+    with threadpool_limits(limits=threads):
+        resultado = treinar_shard(destino, shard_id)
+    return resultado, extrair_registros(inicio)
+
+@etapa
+def treinar_pendentes(destino="shards", shards=None, processos=None):
+    """
+    Treina os shards pendentes (ou apenas `shards`) em até `processos` processos.
+    Retorna {shard: exceção} dos que falharam; os demais ficam concluídos no armazenamento.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import multiprocessing
+
+    manifesto = ler_manifesto(destino)
+    if manifesto is None:
+        raise FileNotFoundError(f"Manifesto não encontrado em {destino}; rode o particionamento antes.")
+    ids = list(shards) if shards else [s["id"] for s in manifesto["shards"]]
+    concluidos = _concluidos(abrir_armazenamento(destino), manifesto)
+    pendentes = [s for s in ids if s not in concluidos]
+    if not pendentes:
+        print(" Todos os shards já estão concluídos.")
+        return {}
+
+    cpus = os.cpu_count() or 1
+    processos = max(1, min(processos or cpus, len(pendentes)))
+    falhas = {}
+    if processos == 1:
+        for sid in pendentes:
+            try:
+                treinar_shard(destino, sid)
+            except Exception as e:
+                falhas[sid] = e
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        threads = max(1, cpus // processos)
+        with ProcessPoolExecutor(max_workers=processos, mp_context=ctx) as ex:
+            futuros = {ex.submit(_treinar_em_worker, destino, sid, threads): sid for sid in pendentes}
+            for fut in as_completed(futuros):
+                try:
+                    _, regs = fut.result()
+                    incorporar(regs)
+                except Exception as e:
+                    falhas[futuros[fut]] = e
+
+    for sid, e in falhas.items():
+        print(f"⚠️ shard {sid} falhou: {e}")
+        evento("shard_falhou", shard=sid, erro=f"{type(e).__name__}: {e}")
+    return falhas
+
+
+# ==============================
+# 3) MESCLAR
+# ==============================
+@etapa
+def mesclar(destino="shards", saida_mapa="clusters_shards.csv"):
+    """
+    Junta os rótulos de todos os shards em IDs de cluster globais, na ordem da
+    base particionada. Grava `saida_mapa` (cluster global -> shard, valor, cluster local).
+    """
+    armaz = abrir_armazenamento(destino)
+    manifesto = ler_manifesto(destino)
+    if manifesto is None:
+        raise FileNotFoundError(f"Manifesto não encontrado em {destino}; rode o particionamento antes.")
+    concluidos = _concluidos(armaz, manifesto)
+    pendentes = [s["id"] for s in manifesto["shards"] if s["id"] not in concluidos]
+    if pendentes:
+        raise RuntimeError(f"Shards pendentes: {', '.join(pendentes)}. Rode `meraki.py shard treinar` "
+                           "(os concluídos são reaproveitados).")
+
+    nomes = [f"{s['id']}/rotulos.csv.gz" for s in manifesto["shards"]]
+    rotulos = _ler_varios(armaz, nomes, _ler_csv)
+
+    labels = np.full(manifesto["linhas"], -1, dtype=int)
+    mapa, inicio = [], 0
+    for s, nome in zip(manifesto["shards"], nomes):
+        k = concluidos[s["id"]]["k"]
+        rot = rotulos[nome]
+        labels[rot[COL_LINHA].to_numpy()] = rot["cluster_local"].to_numpy() + inicio
+        mapa += [{"cluster": inicio + c, "shard": s["id"], manifesto["coluna"]: s["valor"], "cluster_local": c}
+                 for c in range(k)]
+        inicio += k
+    if (labels < 0).any():
+        raise RuntimeError(f"{int((labels < 0).sum())} linhas da base sem rótulo após a mesclagem.")
+
+    pd.DataFrame(mapa).to_csv(saida_mapa, index=False, encoding="utf-8")
+    print(f" {saida_mapa} salvo ({inicio} clusters em {len(manifesto['shards'])} shards).")
+    return labels
+
+def clusterizar_por_shards(base, coluna, destino="shards", ks=(3, 4, 5, 6), amostra_silhouette=None,
+                           processos=None, treinar=True):
+    """Particiona (ou reaproveita), treina os shards pendentes e retorna os rótulos globais."""
+    particionar(base, coluna, destino, ks=ks, amostra_silhouette=amostra_silhouette)
+    if treinar:
+        treinar_pendentes(destino, processos=processos)
+    return mesclar(destino)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Índice aproximado de vizinhos (IVF) para a busca de "clientes semelhantes".
+
+O índice é construído sobre o X_scaled de preparar_features: um quantizador
+grosso (K-Means com ~sqrt(n) listas, ou centróides já treinados) particiona os
+clientes em listas invertidas e cada consulta só varre as `n_sondas` listas
+mais próximas, em vez da base inteira.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+
+# ==============================
+# 1) ÍNDICE IVF
+# ==============================
+class IndiceIVF:
+    """
+    Índice IVF (inverted file) com distância euclidiana.
+
+    n_listas: quantidade de listas invertidas (padrão: ~sqrt(n) clientes)
+    n_sondas: listas visitadas por consulta (troca recall por latência)
+    """
+
+    def __init__(self, n_listas=None, n_sondas=8, random_state=42):
+        self.n_listas = n_listas
+        self.n_sondas = n_sondas
+        self.random_state = random_state
+
+    def construir(self, X_scaled, ids, centroides=None):
+        """
+        X_scaled: matriz (n, d) padronizada (saída de preparar_features)
+        ids: CD_CLIENTE de cada linha de X_scaled
+        centroides: centróides prontos para o quantizador (ex.: modelo.cluster_centers_);
+                    se None, treina um MiniBatchKMeans com n_listas centróides
+        """
+        X = np.ascontiguousarray(X_scaled, dtype=np.float32)
+        self.ids = np.asarray(ids)
+        self.pos_por_id = {cid: i for i, cid in enumerate(self.ids)}
+
+        if centroides is None:
+            from sklearn.cluster import MiniBatchKMeans
+            n_listas = self.n_listas or max(1, int(np.sqrt(len(X))))
+            n_listas = min(n_listas, len(X))
+            km = MiniBatchKMeans(n_clusters=n_listas, random_state=self.random_state,
+                                 batch_size=4096, n_init=1)
+            km.fit(X)
+            centroides = km.cluster_centers_
+        self.centroides = np.ascontiguousarray(centroides, dtype=np.float32)
+        self._norma_c = (self.centroides ** 2).sum(axis=1)
+
+        # Atribui cada cliente à lista do centróide mais próximo
+        lista = self._listas_mais_proximas(X, 1)[:, 0]
+
+        # Armazena as listas de forma contígua (ordenadas por lista)
+        ordem = np.argsort(lista, kind="stable")
+        self._X = X[ordem]
+        self._norma = (self._X ** 2).sum(axis=1)
+        self._pos = ordem                      # posição original em X_scaled
+        self._inv = np.empty(len(X), dtype=np.int64)
+        self._inv[ordem] = np.arange(len(X))   # posição original -> armazenamento
+        contagem = np.bincount(lista, minlength=len(self.centroides))
+        self._offsets = np.concatenate([[0], np.cumsum(contagem)])
+        return self
+
+    def _listas_mais_proximas(self, Q, n):
+        d = self._norma_c[None, :] - 2.0 * (Q @ self.centroides.T)
+        n = min(n, d.shape[1])
+        if n == d.shape[1]:
+            return np.argsort(d, axis=1)
+        part = np.argpartition(d, n - 1, axis=1)[:, :n]
+        ordem = np.take_along_axis(d, part, axis=1).argsort(axis=1)
+        return np.take_along_axis(part, ordem, axis=1)
+
+    def _candidatos(self, listas):
+        return np.concatenate([np.arange(self._offsets[l], self._offsets[l + 1]) for l in listas])
+
+    def buscar(self, x, k=10, n_sondas=None):
+        """
+        Retorna (posições, distâncias) dos k vizinhos aproximados do vetor x,
+        com posições relativas às linhas de X_scaled.
+        """
+        x = np.asarray(x, dtype=np.float32).ravel()
+        listas = self._listas_mais_proximas(x[None, :], n_sondas or self.n_sondas)[0]
+        cand = self._candidatos(listas)
+        d = self._norma[cand] - 2.0 * (self._X[cand] @ x) + float(x @ x)
+        k = min(k, len(cand))
+        top = np.argpartition(d, k - 1)[:k] if k < len(cand) else np.arange(len(cand))
+        top = top[np.argsort(d[top])]
+        return self._pos[cand[top]], np.sqrt(np.maximum(d[top], 0.0))
+
+    def similares(self, cd_cliente, k=10, n_sondas=None):
+        """k clientes mais semelhantes a cd_cliente (exclui o próprio) como DataFrame."""
+        if cd_cliente not in self.pos_por_id:
+            raise KeyError(f"CD_CLIENTE não indexado: {cd_cliente}")
+        pos = self.pos_por_id[cd_cliente]
+        vizinhos, dist = self.buscar(self._X[self._inv[pos]], k + 1, n_sondas)
+        manter = vizinhos != pos
+        return pd.DataFrame({
+            "CD_CLIENTE": self.ids[vizinhos[manter]][:k],
+            "DISTANCIA": dist[manter][:k],
+        })
+
+    def vizinhos_todos(self, k=10, n_sondas=None):
+        """
+        Vizinhos aproximados de TODOS os clientes indexados, em lote.
+        Cada consulta sonda as listas mais próximas dela (as mesmas de buscar);
+        as consultas são agrupadas pela lista sondada, e as distâncias de cada
+        grupo aos clientes da lista saem de um produto de matrizes (BLAS),
+        mesclado ao top-k parcial de cada consulta.
+        Retorna (posições (n, k), distâncias (n, k)); o próprio cliente é excluído
+        e posições faltantes (listas pequenas) ficam como -1 / inf.
+        """
+        n = len(self._pos)
+        sondas = self._listas_mais_proximas(self._X, n_sondas or self.n_sondas)
+
+        # consultas (posição no armazenamento) agrupadas por lista sondada
+        consultas = np.repeat(np.arange(n), sondas.shape[1])
+        listas = sondas.ravel()
+        ordem = np.argsort(listas, kind="stable")
+        consultas = consultas[ordem]
+        limites = np.searchsorted(listas[ordem], np.arange(len(self.centroides) + 1))
+
+        melhor_d = np.full((n, k), np.inf, dtype=np.float32)
+        melhor_i = np.full((n, k), -1, dtype=np.int64)
+        for l in range(len(self.centroides)):
+            ini, fim = self._offsets[l], self._offsets[l + 1]
+            q = consultas[limites[l]:limites[l + 1]]
+            if ini == fim or not len(q):
+                continue
+            d = (self._norma[ini:fim][None, :] - 2.0 * (self._X[q] @ self._X[ini:fim].T)
+                 + self._norma[q][:, None])
+            # exclui o próprio cliente quando ele pertence à lista sondada
+            proprio = (q >= ini) & (q < fim)
+            d[np.nonzero(proprio)[0], q[proprio] - ini] = np.inf
+
+            kk = min(k, fim - ini)
+            top = np.argpartition(d, kk - 1, axis=1)[:, :kk] if kk < fim - ini else np.broadcast_to(np.arange(fim - ini), d.shape)
+            cand_d = np.concatenate([melhor_d[q], np.take_along_axis(d, top, axis=1)], axis=1)
+            cand_i = np.concatenate([melhor_i[q], top + ini], axis=1)
+            sel = np.argpartition(cand_d, k - 1, axis=1)[:, :k]
+            melhor_d[q] = np.take_along_axis(cand_d, sel, axis=1)
+            melhor_i[q] = np.take_along_axis(cand_i, sel, axis=1)
+
+        ordem = melhor_d.argsort(axis=1)
+        melhor_d = np.take_along_axis(melhor_d, ordem, axis=1)
+        melhor_i = np.take_along_axis(melhor_i, ordem, axis=1)
+        viz = np.full((n, k), -1, dtype=np.int64)
+        dist = np.full((n, k), np.inf, dtype=np.float32)
+        validos = np.isfinite(melhor_d)
+        viz[self._pos] = np.where(validos, self._pos[np.maximum(melhor_i, 0)], -1)
+        dist[self._pos] = np.where(validos, np.sqrt(np.maximum(melhor_d, 0.0)), np.inf)
+        return viz, dist
+
+
+# ==============================
+# 2) RECOMENDAÇÃO PONDERADA POR VIZINHOS
+# ==============================
+def recomendar_por_vizinhos(indice, produtos_cliente, k=20, top_n=3, n_sondas=None):
+    """
+    Pontua os produtos dos k vizinhos de cada cliente com peso 1/(1+distância)
+    e devolve {CD_CLIENTE: [produtos]} com os top_n que o cliente ainda não possui.
+
+    produtos_cliente: DataFrame com CD_CLIENTE e DS_PROD (um produto por linha)
+    """
+    viz, dist = indice.vizinhos_todos(k=k, n_sondas=n_sondas)
+
+    pares = pd.DataFrame({
+        "CD_CLIENTE": np.repeat(indice.ids, viz.shape[1]),
+        "VIZINHO": viz.ravel(),
+        "PESO": 1.0 / (1.0 + dist.ravel()),
+    })
+    pares = pares[pares["VIZINHO"] >= 0]
+    pares["VIZINHO"] = indice.ids[pares["VIZINHO"].to_numpy()]
+
+    posse = (produtos_cliente[["CD_CLIENTE", "DS_PROD"]].dropna()
+             .assign(DS_PROD=lambda d: d["DS_PROD"].astype(str))
+             .drop_duplicates())
+    score = (pares.merge(posse.rename(columns={"CD_CLIENTE": "VIZINHO"}), on="VIZINHO")
+                  .groupby(["CD_CLIENTE", "DS_PROD"], as_index=False)["PESO"].sum())
+
+    # remove o que o cliente já possui
+    score = score.merge(posse.assign(_TEM=True), on=["CD_CLIENTE", "DS_PROD"], how="left")
+    score = score[score["_TEM"].isna()]
+
+    score = score.sort_values(["CD_CLIENTE", "PESO", "DS_PROD"], ascending=[True, False, True])
+    score = score[score.groupby("CD_CLIENTE").cumcount() < top_n]
+    print(f" Vizinhos: {score['CD_CLIENTE'].nunique()} clientes pontuados com k={k}.")
+    return score.groupby("CD_CLIENTE")["DS_PROD"].apply(list).to_dict()
+
+
+# ==============================
+# 3) BENCHMARK RECALL x LATÊNCIA
+# ==============================
+def benchmark_recall_latencia(X_scaled, ids, k=10, sondas=(1, 2, 4, 8, 16),
+                              n_consultas=200, n_listas=None, random_state=42):
+    """
+    Compara o IndiceIVF com a força bruta exata em uma amostra de consultas.
+    Retorna DataFrame com recall@k e latências (ms) por valor de n_sondas, para
+    a consulta unitária (buscar, usada pela API) e para o lote (vizinhos_todos,
+    usado por recomendar_por_vizinhos); no lote a latência é o tempo total
+    dividido pelo nº de clientes.
+    """
+    X = np.ascontiguousarray(X_scaled, dtype=np.float32)
+    rng = np.random.default_rng(random_state)
+    consultas = rng.choice(len(X), size=min(n_consultas, len(X)), replace=False)
+
+    t0 = time.perf_counter()
+    indice = IndiceIVF(n_listas=n_listas, random_state=random_state).construir(X, ids)
+    t_build = time.perf_counter() - t0
+    print(f" Índice IVF: {len(indice.centroides)} listas construídas em {t_build:.2f}s")
+
+    # Força bruta exata
+    norma = (X ** 2).sum(axis=1)
+    exatos, lat_bf = [], []
+    for q in consultas:
+        t = time.perf_counter()
+        d = norma - 2.0 * (X @ X[q])
+        kk = min(k, len(d) - 1)
+        top = np.argpartition(d, kk)[:kk + 1]
+        top = top[np.argsort(d[top])]
+        lat_bf.append(time.perf_counter() - t)
+        exatos.append(set(top[top != q][:k]))
+
+    linhas = [{
+        "metodo": "forca_bruta", "n_sondas": None, "recall": 1.0,
+        "lat_media_ms": 1e3 * np.mean(lat_bf), "lat_p50_ms": 1e3 * np.median(lat_bf),
+        "lat_p99_ms": 1e3 * np.percentile(lat_bf, 99),
+    }]
+    for s in sondas:
+        acertos, lat = 0, []
+        for q, verdade in zip(consultas, exatos):
+            t = time.perf_counter()
+            viz, _ = indice.buscar(X[q], k + 1, n_sondas=s)
+            lat.append(time.perf_counter() - t)
+            acertos += len(set(viz[viz != q][:k]) & verdade)
+        linhas.append({
+            "metodo": "ivf", "n_sondas": s, "recall": acertos / max(sum(map(len, exatos)), 1),
+            "lat_media_ms": 1e3 * np.mean(lat), "lat_p50_ms": 1e3 * np.median(lat),
+            "lat_p99_ms": 1e3 * np.percentile(lat, 99),
+        })
+
+        t = time.perf_counter()
+        viz, _ = indice.vizinhos_todos(k, n_sondas=s)
+        t_lote = time.perf_counter() - t
+        acertos = sum(len(set(viz[q][viz[q] >= 0]) & verdade) for q, verdade in zip(consultas, exatos))
+        linhas.append({
+            "metodo": "ivf_lote", "n_sondas": s, "recall": acertos / max(sum(map(len, exatos)), 1),
+            "lat_media_ms": 1e3 * t_lote / len(X), "lat_p50_ms": np.nan, "lat_p99_ms": np.nan,
+        })
+
+    res = pd.DataFrame(linhas)
+    res["n_sondas"] = res["n_sondas"].astype("Int64")
+    print(res.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    return res
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de perfil dos clusters: todas as estatísticas por cluster (tamanho,
+médias, quantis, composição por segmento/UF/faixa de faturamento e resumo da
+distribuição de MRR) calculadas de forma agrupada e vetorizada, e rótulos de
+persona atribuídos com np.select sobre essas estatísticas.
+
+Alimenta cluster_summary.xlsx (salvar_resultados), clusters_rotulados.csv e os
+gráficos de visual.py.
+"""
+
+import numpy as np
+import pandas as pd
+
+COLS_CATEGORICAS = ("DS_SEGMENTO", "UF", "FAT_FAIXA")
+QUANTIS = (0.25, 0.5, 0.75)
+
+# (coluna, dimensão da persona) – ordem usada no rótulo
+DIMENSOES_ROTULO = [
+    ("MRR_12M", "Receita"),
+    ("NPS_MEDIO", "Satisfação"),
+    ("QTD_CONTRATACOES_12M", "Aquisição"),
+]
+
+
+# ==============================
+# 1) PERFIL
+# ==============================
+def _resumo_boxplot(valores, grupos, quantis):
+    """
+    Estatísticas de boxplot por cluster (formato de matplotlib Axes.bxp):
+    q1/mediana/q3 dos quantis já calculados e bigodes em 1,5 * IQR,
+    limitados aos valores observados.
+    """
+    q1, med, q3 = quantis[0.25], quantis[0.5], quantis[0.75]
+    iqr = q3 - q1
+    lim_inf = grupos.map(q1 - 1.5 * iqr)
+    lim_sup = grupos.map(q3 + 1.5 * iqr)
+    g = valores.groupby(grupos)
+    return pd.DataFrame({
+        "n": g.count(),
+        "media": g.mean(),
+        "min": g.min(),
+        "q1": q1,
+        "mediana": med,
+        "q3": q3,
+        "max": g.max(),
+        "bigode_inf": valores.where(valores >= lim_inf).groupby(grupos).min(),
+        "bigode_sup": valores.where(valores <= lim_sup).groupby(grupos).max(),
+    })
+
+
+def perfilar_clusters(df, col_cluster="cluster", num_cols=None,
+                      cat_cols=COLS_CATEGORICAS, col_mrr="MRR_12M"):
+    """
+    df: uma linha por cliente, com a coluna de cluster
+    num_cols: colunas numéricas (padrão: todas as numéricas exceto o cluster)
+    cat_cols: colunas categóricas para composição (as ausentes são ignoradas)
+
+    Retorna dict com:
+      tamanho     Series  clientes por cluster
+      medias      DataFrame cluster x num_cols
+      quantis     DataFrame (cluster, quantil) x num_cols
+      composicao  {coluna: DataFrame cluster x categoria (contagens)}
+      mrr         DataFrame cluster x estatísticas de boxplot (se col_mrr existir)
+    """
+    dados = df[df[col_cluster].notna()]
+    if num_cols is None:
+        num_cols = [c for c in dados.columns
+                    if c != col_cluster and pd.api.types.is_numeric_dtype(dados[c])
+                    and not pd.api.types.is_bool_dtype(dados[c])]
+    num_cols = list(num_cols)
+
+    g = dados.groupby(col_cluster, sort=True)
+    perfil = {
+        "tamanho": g.size().rename("QTD"),
+        "medias": g[num_cols].mean(),
+        "quantis": g[num_cols].quantile(list(QUANTIS)),
+        "composicao": {},
+    }
+    for c in cat_cols:
+        if c in dados.columns:
+            perfil["composicao"][c] = (dados.groupby([col_cluster, c], sort=True).size()
+                                            .unstack(fill_value=0))
+
+    if col_mrr in num_cols:
+        q = perfil["quantis"][col_mrr].unstack()
+        perfil["mrr"] = _resumo_boxplot(dados[col_mrr], dados[col_cluster], q)
+    return perfil
+
+
+# ==============================
+# 2) RÓTULOS (PERSONAS)
+# ==============================
+def rotular_clusters(medias, dimensoes=DIMENSOES_ROTULO, tercis=(0.33, 0.67)):
+    """
+    Rótulo legível por cluster a partir das médias: cada dimensão vira
+    Baixo/Médio/Alto conforme os tercis das médias entre clusters
+    (<= tercil inferior: Baixo; >= tercil superior: Alto; NaN: Médio).
+    Retorna Series indexada por cluster.
+    """
+    partes = []
+    for col, nome in dimensoes:
+        if col not in medias.columns:
+            continue
+        v = medias[col].to_numpy(dtype=float)
+        q_inf, q_sup = medias[col].quantile(list(tercis)).to_numpy()
+        nivel = np.select([np.isnan(v), v <= q_inf, v >= q_sup], ["Médio", "Baixo", "Alto"], "Médio")
+        partes.append(nome + " " + pd.Series(nivel, index=medias.index))
+
+    if not partes:
+        return pd.Series("", index=medias.index, name="cluster_label")
+    rotulo = partes[0]
+    for p in partes[1:3]:
+        rotulo = rotulo + ", " + p
+    return rotulo.rename("cluster_label")
+
+
+# ==============================
+# 3) TABELAS PARA O RESUMO
+# ==============================
+def tabelas_resumo(perfil, col_cluster="cluster"):
+    """Converte o perfil em abas {nome: DataFrame} para cluster_summary.xlsx."""
+    abas = {"metricas_medias": perfil["medias"].reset_index()}
+
+    comp = perfil["composicao"]
+    if "DS_SEGMENTO" in comp:
+        abas["segmento_contagem"] = (comp["DS_SEGMENTO"].stack().rename("QTD").reset_index()
+                                     .query("QTD > 0"))
+    abas["tamanho"] = perfil["tamanho"].reset_index()
+    abas["quantis"] = perfil["quantis"].rename_axis([col_cluster, "quantil"]).reset_index()
+    for c, tab in comp.items():
+        if c != "DS_SEGMENTO":
+            abas[f"composicao_{c.lower()}"] = tab.stack().rename("QTD").reset_index().query("QTD > 0")
+    if "mrr" in perfil:
+        abas["mrr_distribuicao"] = perfil["mrr"].reset_index()
+    return abas
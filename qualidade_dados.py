@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Validação de qualidade dos arquivos brutos do ETL.
+
+Cada arquivo é validado logo após o parsing, na mesma thread do parser, com
+verificações vetorizadas por coluna em uma única passada:
+
+    LINHA_MALFORMADA      mais campos que o cabeçalho             -> linha descartada pelo parser
+    COLUNA_AUSENTE        coluna obrigatória inexistente          (nível de arquivo)
+    CHAVE_NAO_ENCONTRADA  nenhuma coluna de chave de cliente      (nível de arquivo)
+    CHAVE_VAZIA           linha sem chave de cliente              -> linha removida
+    NUMERICO_INVALIDO     valor não numérico em coluna numérica   -> célula anulada
+    FORA_DA_FAIXA         valor fora da faixa esperada            -> célula anulada
+
+As colunas numéricas que o ETL converteria do mesmo jeito (formato None ou
+"virgula") já saem convertidas para float, e o tratamento não as reconverte;
+as de formato "br" mantêm o texto original para preparar_features.
+
+As linhas com problema (com os valores originais, a linha do arquivo e os
+motivos) vão para quarentena/<fonte>.parquet, ou .csv.gz se não houver engine
+Parquet instalada. O resumo por fonte vai para qualidade_relatorio.csv.
+"""
+
+import io
+import os
+import re
+import csv
+import fnmatch
+import threading
+
+import numpy as np
+import pandas as pd
+
+PASTA_QUARENTENA = "quarentena"
+
+CHAVES_CLIENTE = (
+    "CD_CLIENTE", "CLIENTE", "IdCliente", "ID_CLIENTE",
+    "COD_CLIENTE", "CODIGO_CLIENTE", "CD_CLI", "metadata_codcliente",
+)
+
+# fonte (nome ou padrão) -> regras. Colunas podem ser tuplas de nomes alternativos.
+# formato numérico: None = pd.to_numeric, "virgula" = ',' decimal, "br" = '.' milhar e ',' decimal
+ESQUEMAS = {
+    "dados_clientes.csv": {
+        "obrigatorias": ["DS_SEGMENTO", "UF", "DS_PROD"],
+        "chave": CHAVES_CLIENTE,
+        "numericas": {"VL_TOTAL_CONTRATO": {"min": 0, "formato": "br"}},
+    },
+    "clientes_desde.csv": {"chave": CHAVES_CLIENTE},
+    "historico.csv": {"chave": CHAVES_CLIENTE},
+    "mrr.csv": {
+        "chave": CHAVES_CLIENTE,
+        "numericas": {"MRR_12M": {"min": 0, "formato": "virgula"}},
+    },
+    "contratacoes_ultimos_12_meses.csv": {
+        "chave": CHAVES_CLIENTE,
+        "numericas": {"QTD_CONTRATACOES_12M": {"min": 0, "formato": "virgula"},
+                      "VLR_CONTRATACOES_12M": {"min": 0, "formato": "virgula"}},
+    },
+    "nps_*.csv": {
+        "chave": CHAVES_CLIENTE,
+        "numericas": {("resposta_NPS", "NPS", "nota_nps"): {"min": 0, "max": 10}},
+    },
+    "tickets.csv": {"obrigatorias": ["BK_TICKET", "CODIGO_ORGANIZACAO", "STATUS_TICKET"]},
+    "telemetria_*.csv": {"chave": CHAVES_CLIENTE + ("clienteid",)},
+}
+
+_relatorio = []
+_lock = threading.Lock()
+
+
+# ==============================
+# Linhas malformadas
+# ==============================
+def linhas_malformadas(conteudo, encoding, df):
+    """
+    Linhas que pd.read_csv(..., on_bad_lines="skip") descartou ao gerar `df`
+    (mais campos que o cabeçalho), como DataFrame _linha, _detalhe. Se o nº de
+    linhas do arquivo bate com cabeçalho + registros lidos, nada foi descartado
+    e o arquivo não é percorrido de novo; senão, o módulo csv localiza cada uma.
+    Não usa warnings, cujo estado é global e não serve a parsers em paralelo.
+    """
+    linhas = conteudo.count(b"\n") + (bool(conteudo) and not conteudo.endswith(b"\n"))
+    # coluna de índice inferida pelo pandas (1ª linha com um campo a mais) também conta
+    campos = len(df.columns) + (0 if df.index.equals(pd.RangeIndex(len(df))) else df.index.nlevels)
+    achados = []
+    if linhas != len(df) + 1:
+        leitor = csv.reader(io.StringIO(conteudo.decode(encoding), newline=""), delimiter=";")
+        cabecalho = False
+        for valores in leitor:
+            if not valores:
+                continue
+            if not cabecalho:
+                cabecalho = True
+            elif len(valores) > campos:
+                achados.append((leitor.line_num, f"expected {campos} fields, saw {len(valores)}"))
+    return pd.DataFrame({"_linha": [n for n, _ in achados], "_detalhe": [d for _, d in achados]})
+
+
+# ==============================
+# Validação
+# ==============================
+def _esquema(fonte):
+    if fonte in ESQUEMAS:
+        return ESQUEMAS[fonte]
+    for padrao, esquema in ESQUEMAS.items():
+        if fnmatch.fnmatch(fonte, padrao):
+            return esquema
+    return {}
+
+def _resolver(colunas, nomes):
+    """Primeira coluna existente entre `nomes` (sem diferenciar maiúsculas)."""
+    por_nome = {c.lower(): c for c in colunas}
+    for n in (nomes if isinstance(nomes, tuple) else (nomes,)):
+        if n.lower() in por_nome:
+            return por_nome[n.lower()]
+    return None
+
+def _para_float(valores):
+    """ndarray de objetos -> float; conversão direta do numpy quando todos os valores são válidos."""
+    try:
+        return valores.astype(float)
+    except (ValueError, TypeError):
+        return pd.to_numeric(pd.Series(valores), errors="coerce").to_numpy(dtype=float)
+
+def _numerico(serie, formato=None):
+    """Mesma conversão do ETL (formato None/"virgula") ou de preparar_features ("br")."""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.to_numpy(dtype=float)
+    if formato == "br":
+        # valores repetidos por linha de produto: converte só os distintos
+        codigos, valores = pd.factorize(serie)
+        texto = pd.Series(valores).astype(str).str.replace(r"\s+", "", regex=True)
+        conv = _para_float(texto.str.replace(".", "", regex=False)
+                                .str.replace(",", ".", regex=False).to_numpy(dtype=object))
+        return np.where(codigos >= 0, conv[np.maximum(codigos, 0)] if len(conv) else np.nan, np.nan)
+    if formato == "virgula":
+        serie = serie.str.replace(",", ".", regex=False)
+    return _para_float(serie.to_numpy(dtype=object))
+
+def _linhas_arquivo(posicoes, ruins):
+    """
+    Linha do arquivo de cada registro lido (cabeçalho = linha 1), descontando
+    as linhas malformadas descartadas antes dele. Aproximada se o arquivo tiver
+    linhas em branco ou campos com quebra de linha.
+    """
+    base = np.asarray(posicoes) + 2
+    if not len(ruins):
+        return base
+    b = np.sort(np.asarray(ruins))
+    return base + np.searchsorted(b - np.arange(len(b)), base, side="right")
+
+def validar(fonte, df, ruins=None):
+    """
+    Valida `df` (arquivo `fonte` recém-lido) conforme ESQUEMAS, grava a
+    quarentena da fonte e acumula o relatório. Retorna o DataFrame sem as
+    linhas sem chave e com as células inválidas anuladas.
+    """
+    esquema = _esquema(fonte)
+    ruins = ruins if ruins is not None else pd.DataFrame({"_linha": [], "_detalhe": []})
+    n = len(df)
+    rel = [(fonte, "LINHAS_LIDAS", "", n + len(ruins), 0)]
+    if len(ruins):
+        rel.append((fonte, "LINHA_MALFORMADA", "", n + len(ruins), len(ruins)))
+
+    for nomes in esquema.get("obrigatorias", []):
+        if _resolver(df.columns, nomes) is None:
+            rel.append((fonte, "COLUNA_AUSENTE", nomes if isinstance(nomes, str) else "|".join(nomes), n, n))
+
+    falhas = []   # (máscara, código)
+    remover = np.zeros(n, dtype=bool)
+    if "chave" in esquema:
+        chave = _resolver(df.columns, esquema["chave"])
+        if chave is None:
+            rel.append((fonte, "CHAVE_NAO_ENCONTRADA", "", n, n))
+        else:
+            vazia = df[chave].isna().to_numpy()
+            rel.append((fonte, "CHAVE_VAZIA", chave, n, int(vazia.sum())))
+            falhas.append((vazia, "CHAVE_VAZIA"))
+            remover |= vazia
+
+    anular, convertidas = {}, {}
+    for nomes, regra in esquema.get("numericas", {}).items():
+        col = _resolver(df.columns, nomes)
+        if col is None:
+            continue
+        num = _numerico(df[col], regra.get("formato"))
+        if regra.get("formato") != "br":
+            convertidas[col] = num
+        invalido = df[col].notna().to_numpy() & np.isnan(num)
+        fora = np.zeros(n, dtype=bool)
+        if regra.get("min") is not None:
+            fora |= num < regra["min"]
+        if regra.get("max") is not None:
+            fora |= num > regra["max"]
+        rel.append((fonte, "NUMERICO_INVALIDO", col, n, int(invalido.sum())))
+        rel.append((fonte, "FORA_DA_FAIXA", col, n, int(fora.sum())))
+        falhas += [(invalido, f"NUMERICO_INVALIDO:{col}"), (fora, f"FORA_DA_FAIXA:{col}")]
+        if invalido.any() or fora.any():
+            anular[col] = invalido | fora
+
+    # quarentena: só as linhas com alguma falha (valores originais + motivos)
+    algum = np.zeros(n, dtype=bool)
+    for m, _ in falhas:
+        algum |= m
+    pos = np.nonzero(algum)[0]
+    partes = []
+    if len(pos):
+        motivo = pd.Series("", index=pos)
+        for m, cod in falhas:
+            sel = m[pos]
+            if sel.any():
+                motivo[sel] = motivo[sel] + cod + ";"
+        q = df.iloc[pos].astype("string").reset_index(drop=True)
+        q.insert(0, "_motivo", motivo.str.rstrip(";").to_numpy())
+        q.insert(0, "_linha", _linhas_arquivo(pos, ruins["_linha"]))
+        partes.append(q)
+    if len(ruins):
+        partes.insert(0, ruins.assign(_motivo="LINHA_MALFORMADA"))
+    destino = _gravar_quarentena(fonte, pd.concat(partes, ignore_index=True) if partes else None)
+
+    with _lock:
+        _relatorio.extend(r + (destino,) for r in rel)
+    n_quar = len(ruins) + len(pos)
+    if n_quar or any(r[1] in ("COLUNA_AUSENTE", "CHAVE_NAO_ENCONTRADA") for r in rel):
+        print(f" ⚠️ qualidade {fonte}: {n_quar} linha(s) em quarentena, {int(remover.sum())} removida(s)"
+              + (f" -> {destino}" if destino else ""))
+
+    # df acabou de ser lido pelo parser: pode ser alterado no lugar
+    for col, num in convertidas.items():
+        df[col] = pd.Series(num, index=df.index)
+    for col, m in anular.items():
+        df[col] = df[col].mask(m)
+    if not remover.any():
+        return df
+    return df[~remover].reset_index(drop=True)
+
+def _gravar_quarentena(fonte, q):
+    """Grava (ou remove, se não houver falhas) a quarentena da fonte; retorna o caminho."""
+    nome = os.path.join(PASTA_QUARENTENA, os.path.splitext(fonte)[0])
+    for ext in (".parquet", ".csv.gz"):
+        if os.path.exists(nome + ext):
+            os.remove(nome + ext)
+    if q is None or q.empty:
+        return ""
+    os.makedirs(PASTA_QUARENTENA, exist_ok=True)
+    try:
+        q.to_parquet(nome + ".parquet", index=False)
+        return nome + ".parquet"
+    except ImportError:   # sem pyarrow/fastparquet
+        q.to_csv(nome + ".csv.gz", index=False, encoding="utf-8", compression="gzip")
+        return nome + ".csv.gz"
+
+
+# ==============================
+# Relatório
+# ==============================
+def registrar_arquivo(fonte, verificacao, coluna="", linhas=0, falhas=None):
+    """
+    Problema detectado no tratamento: `falhas` das `linhas` verificadas
+    (padrão: todas, ex.: coluna esperada ausente).
+    """
+    with _lock:
+        _relatorio.append((fonte, verificacao, coluna, linhas, linhas if falhas is None else falhas, ""))
+
+def gravar_relatorio(caminho="qualidade_relatorio.csv"):
+    """Grava o relatório acumulado desta execução (uma linha por fonte x verificação)."""
+    with _lock:
+        linhas, _relatorio[:] = list(_relatorio), []
+    if not linhas:
+        return None
+    rel = pd.DataFrame(linhas, columns=["fonte", "verificacao", "coluna", "linhas", "falhas", "quarentena"])
+    rel["taxa_ok"] = (1 - rel["falhas"] / rel["linhas"].where(rel["linhas"] > 0)).round(6)
+    rel.to_csv(caminho, index=False, encoding="utf-8")
+    print(f" {caminho} salvo ({rel['fonte'].nunique()} fontes, {int((rel['falhas'] > 0).sum())} verificações com falha).")
+    return rel
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Escrita de relatórios grandes com memória limitada.
+
+- RelatorioXLSX: xlsxwriter em modo constant_memory (cada linha vai para disco
+  assim que a seguinte começa), escrita em lotes e divisão automática em abas
+  <nome>, <nome>_2, ... ao atingir o limite de linhas do Excel.
+- EscritorCSV: CSV escrito em lotes, comprimido com gzip quando o caminho
+  termina em .gz (exports grandes, ex.: recomendações por cliente).
+
+Só a biblioteca padrão é importada no carregamento; xlsxwriter entra quando uma
+planilha é de fato escrita.
+"""
+
+import os
+import csv
+import gzip
+
+LIMITE_LINHAS_EXCEL = 1_048_576   # linhas por aba no Excel (incluindo o cabeçalho)
+LIMITE_NOME_ABA = 31
+TAMANHO_LOTE = 50_000
+
+
+# ==============================
+# Helpers
+# ==============================
+def abrir_texto(caminho, modo="r"):
+    """Abre um arquivo texto UTF-8, via gzip quando o caminho termina em .gz."""
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, modo + "t", encoding="utf-8", newline="", compresslevel=6)
+    return open(caminho, modo, encoding="utf-8", newline="")
+
+def resolver_texto(caminho):
+    """
+    Caminho efetivo de uma saída que pode ter sido gravada com ou sem .gz
+    (ex.: recommend --gzip): entre `caminho` e sua outra variante, a existente
+    mais recente. Sem nenhuma, devolve `caminho`.
+    """
+    base = caminho[:-3] if caminho.endswith(".gz") else caminho
+    existentes = [c for c in (base, base + ".gz") if os.path.exists(c)]
+    return max(existentes, key=os.path.getmtime) if existentes else caminho
+
+def _lotes(dados, tamanho_lote):
+    """DataFrame -> fatias de `tamanho_lote` linhas; iteráveis de DataFrames passam direto."""
+    if hasattr(dados, "iloc"):
+        for i in range(0, len(dados), tamanho_lote):
+            yield dados.iloc[i:i + tamanho_lote]
+    else:
+        yield from dados
+
+def _linhas(lote):
+    """
+    Linhas do lote como tuplas de tipos Python; NaN/NA viram célula vazia e
+    ±inf vira o texto "inf"/"-inf", como em DataFrame.to_excel.
+    """
+    valores = lote.astype(object).where(lote.notna(), None)
+    for i, tipo in enumerate(lote.dtypes):
+        if tipo.kind == "f":
+            coluna = lote.iloc[:, i].to_numpy()
+            infinitos = (coluna == float("inf")) | (coluna == float("-inf"))
+            if infinitos.any():
+                valores.iloc[infinitos, i] = ["inf" if v > 0 else "-inf" for v in coluna[infinitos]]
+    return valores.itertuples(index=False, name=None)
+
+
+# ==============================
+# XLSX
+# ==============================
+class RelatorioXLSX:
+    """
+    Planilha escrita em streaming. Uso:
+
+        with RelatorioXLSX("saida.xlsx") as rel:
+            rel.escrever("top_produtos", df)                              # DataFrame
+            rel.escrever("clientes", pd.read_csv(f, chunksize=50_000))    # lotes
+
+    Cada tabela deve ser escrita de uma vez (constant_memory não volta a linhas
+    anteriores); tabelas maiores que `linhas_por_aba` continuam em <nome>_2, ...
+    """
+
+    def __init__(self, caminho, linhas_por_aba=LIMITE_LINHAS_EXCEL, tamanho_lote=TAMANHO_LOTE):
+        import xlsxwriter
+        if linhas_por_aba < 2:
+            raise ValueError("linhas_por_aba precisa comportar o cabeçalho e ao menos uma linha.")
+        self.caminho = caminho
+        self.linhas_por_aba = linhas_por_aba
+        self.tamanho_lote = tamanho_lote
+        self.abas = []
+        self._wb = xlsxwriter.Workbook(caminho, {
+            "constant_memory": True,
+            "strings_to_formulas": False,   # nomes de produto iniciados por "=" ficam como texto
+            "strings_to_urls": False,
+            "nan_inf_to_errors": True,      # NaN/inf que escapem de _linhas (colunas object) viram erro do Excel
+            "default_date_format": "yyyy-mm-dd hh:mm:ss",   # mesmo formato de DataFrame.to_excel
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        if self._wb is not None:
+            self._wb.close()
+            self._wb = None
+
+    def _nova_aba(self, nome, parte, colunas):
+        sufixo = "" if parte == 1 else f"_{parte}"
+        titulo = nome[:LIMITE_NOME_ABA - len(sufixo)] + sufixo
+        ws = self._wb.add_worksheet(titulo)
+        ws.write_row(0, 0, [str(c) for c in colunas])
+        self.abas.append(titulo)
+        return ws
+
+    def escrever(self, nome, dados, colunas=None):
+        """
+        Escreve `dados` (DataFrame ou iterável de DataFrames) a partir da aba
+        `nome`. `colunas` garante o cabeçalho quando não houver nenhum lote.
+        Retorna o total de linhas escritas.
+        """
+        ws, parte, linha, total = None, 1, 0, 0
+        for lote in _lotes(dados, self.tamanho_lote):
+            if ws is None:
+                colunas = list(lote.columns)
+                ws, linha = self._nova_aba(nome, parte, colunas), 1
+            for valores in _linhas(lote):
+                if linha >= self.linhas_por_aba:
+                    parte += 1
+                    ws, linha = self._nova_aba(nome, parte, colunas), 1
+                ws.write_row(linha, 0, valores)
+                linha += 1
+            total += len(lote)
+
+        if ws is None:
+            if colunas is None and hasattr(dados, "columns"):
+                colunas = list(dados.columns)
+            self._nova_aba(nome, parte, colunas or [])
+        return total
+
+
+# ==============================
+# CSV
+# ==============================
+class EscritorCSV:
+    """
+    CSV em lotes com o mesmo formato de DataFrame.to_csv(index=False); gzip se
+    o caminho terminar em .gz. Aceita DataFrames ou listas de tuplas.
+    """
+
+    def __init__(self, caminho, colunas):
+        self.caminho = caminho
+        self.colunas = list(colunas)
+        self.linhas = 0
+        self._f = abrir_texto(caminho, "w")
+        self._w = csv.writer(self._f, lineterminator="\n")
+        self._w.writerow(self.colunas)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def escrever(self, linhas):
+        if hasattr(linhas, "to_csv"):
+            linhas[self.colunas].to_csv(self._f, header=False, index=False, lineterminator="\n")
+        else:
+            self._w.writerows(linhas)
+        self.linhas += len(linhas)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+API HTTP mínima (biblioteca padrão) para consultar as saídas do pipeline:
+
+    GET /saude
+    GET /recomendacoes/<CD_CLIENTE>          -> recomendacoes_por_cliente.csv (ou .csv.gz)
+    GET /similares/<CD_CLIENTE>?k=10         -> IndiceIVF sobre a base analítica
+
+As recomendações são lidas com o módulo csv; pandas/scikit-learn só são
+carregados quando o índice de clientes semelhantes é construído.
+"""
+
+import csv
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+from relatorios import abrir_texto, resolver_texto
+
+
+class EstadoServidor:
+    def __init__(self, recs_csv="recomendacoes_por_cliente.csv"):
+        self.recs_csv = recs_csv
+        self.recomendacoes = {}
+        self._indice = None
+        self._lock = threading.Lock()
+
+    def carregar_recomendacoes(self):
+        caminho = resolver_texto(self.recs_csv)
+        try:
+            with abrir_texto(caminho) as f:
+                self.recomendacoes = {
+                    row["CD_CLIENTE"]: {
+                        "cluster": row.get("cluster"),
+                        "recomendacoes": [p.strip() for p in (row.get("RECOMENDACOES") or "").split(",") if p.strip()],
+                    }
+                    for row in csv.DictReader(f)
+                }
+            print(f" {len(self.recomendacoes)} clientes carregados de {caminho}.")
+        except FileNotFoundError:
+            print(f"⚠️ {self.recs_csv} não encontrado; /recomendacoes ficará vazio.")
+
+    def indice(self):
+        # construído uma única vez, no primeiro uso
+        if self._indice is None:
+            with self._lock:
+                if self._indice is None:
+                    import meraki_cluster_recomendacao as mcr
+                    from meraki_vizinhos import IndiceIVF
+                    df, _, X_scaled, _ = mcr.preparar_features(mcr.carregar_ou_construir_base())
+                    ids = df["CD_CLIENTE"].astype(str).values
+                    self._indice = IndiceIVF().construir(X_scaled, ids)
+                    print(f" Índice de semelhantes construído ({len(ids)} clientes).")
+        return self._indice
+
+
+def _criar_handler(estado):
+    class Handler(BaseHTTPRequestHandler):
+        def _responder(self, status, corpo):
+            dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            partes = [unquote(p) for p in url.path.strip("/").split("/") if p]
+            if partes == ["saude"]:
+                return self._responder(200, {"ok": True})
+            if len(partes) == 2 and partes[0] == "recomendacoes":
+                rec = estado.recomendacoes.get(partes[1])
+                if rec is None:
+                    return self._responder(404, {"erro": f"CD_CLIENTE não encontrado: {partes[1]}"})
+                return self._responder(200, {"CD_CLIENTE": partes[1], **rec})
+            if len(partes) == 2 and partes[0] == "similares":
+                try:
+                    k = int(parse_qs(url.query).get("k", ["10"])[0])
+                    viz = estado.indice().similares(partes[1], k=k)
+                except KeyError as e:
+                    return self._responder(404, {"erro": str(e).strip("'\"")})
+                except ValueError:
+                    return self._responder(400, {"erro": "parâmetro k inválido"})
+                return self._responder(200, {
+                    "CD_CLIENTE": partes[1],
+                    "similares": [{"CD_CLIENTE": c, "distancia": round(float(d), 6)}
+                                  for c, d in zip(viz["CD_CLIENTE"], viz["DISTANCIA"])],
+                })
+            return self._responder(404, {"erro": "rota não encontrada"})
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def servir(host="127.0.0.1", porta=8000, similares=False, recs_csv="recomendacoes_por_cliente.csv"):
+    estado = EstadoServidor(recs_csv)
+    estado.carregar_recomendacoes()
+    if similares:
+        estado.indice()
+    srv = ThreadingHTTPServer((host, porta), _criar_handler(estado))
+    print(f" Servindo em http://{host}:{porta} (Ctrl+C para encerrar)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
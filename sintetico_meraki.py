@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Gerador de dados sintéticos com o mesmo layout dos arquivos do bucket S3
+(pasta dados/): CSVs separados por ';', decimais com vírgula e popularidade
+de produtos com cauda longa (Zipf), para testes e benchmarks sem acesso à TOTVS.
+
+Uso:
+    python sintetico_meraki.py --clientes 100000 --saida dados_sinteticos
+    MERAKI_DADOS_DIR=dados_sinteticos python etl_s3_totvs.py
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+SEGMENTOS = {
+    "LOGISTICA": ["TRANSPORTE", "ARMAZENAGEM", "OPERADOR LOGISTICO"],
+    "VAREJO": ["SUPERMERCADOS", "MODA", "FARMACIAS", "MATERIAIS DE CONSTRUCAO"],
+    "MANUFATURA": ["BENS DURAVEIS", "BENS NAO DURAVEIS", "AUTOPECAS"],
+    "SERVICOS": ["PROVEDOR SERVICOS", "CONSULTORIA", "SAUDE", "EDUCACIONAL"],
+}
+UFS = ["SP", "RJ", "MG", "PR", "SC", "RS", "BA", "GO", "PE", "CE", "ES", "DF", "MT", "PA", "AM"]
+CIDADES = {
+    "SP": ["SAOPAULO", "CAMPINAS", "SANTOS", "SOROCABA"], "RJ": ["RIODEJANEIRO", "NITEROI"],
+    "MG": ["BELOHORIZONTE", "UBERLANDIA"], "PR": ["CURITIBA", "LONDRINA"],
+    "SC": ["JOINVILLE", "FLORIANOPOLIS", "BLUMENAU"], "RS": ["PORTOALEGRE", "CAXIASDOSUL"],
+    "BA": ["SALVADOR"], "GO": ["GOIANIA"], "PE": ["RECIFE"], "CE": ["FORTALEZA"],
+    "ES": ["VITORIA"], "DF": ["BRASILIA"], "MT": ["CUIABA"], "PA": ["BELEM"], "AM": ["MANAUS"],
+}
+FAIXAS = [
+    "Faixa 01 - Ate 1,5 M", "Faixa 02 - De 1,5 M ate 4,8 M", "Faixa 03 - De 4,8 M ate 10 M",
+    "Faixa 04 - De 10 M ate 20 M", "Faixa 05 - De 20 M ate 50 M", "Faixa 06 - De 50 M ate 100 M",
+    "Faixa 07 - De 100 M ate 150 M", "Faixa 08 - De 150 M ate 300 M",
+    "Faixa 09 - Acima de 300 M", "Sem Informações de Faturamento",
+]
+ARQUIVOS_NPS = [
+    "nps_relacional.csv",
+    "nps_transacional_aquisicao.csv",
+    "nps_transacional_implantacao.csv",
+    "nps_transacional_onboarding.csv",
+    "nps_transacional_produto.csv",
+    "nps_transacional_suporte.csv",
+]
+N_TELEMETRIA = 11
+
+_PREFIXOS = ["TOTVS", "SMS", "CDU", "TEF", "USUARIO", "LICENCA", "MODULO", "PORTAL"]
+_MODULOS = ["RETAGUARDA", "BACKOFFICE", "FOLHA", "FISCAL", "WMS", "TMS", "CRM", "BI",
+            "ESTOQUE", "COMPRAS", "FINANCEIRO", "PDV", "FROTAS", "MANUTENCAO", "RH"]
+_SUFIXOS = ["WT", "CLOUD", "I TRAD", "ADICIONAL", "PRINCIPAL", "PLUS", "ONLINE", "SAAS", "BASIC"]
+
+
+# ==============================
+# Helpers
+# ==============================
+def _catalogo_produtos(n_produtos, rng):
+    nomes = np.array([f"{p} {m} {s}" for p in _PREFIXOS for m in _MODULOS for s in _SUFIXOS])
+    rng.shuffle(nomes)
+    if n_produtos > len(nomes):
+        extra = [f"{n} {i}" for i, n in enumerate(np.resize(nomes, n_produtos - len(nomes)))]
+        nomes = np.concatenate([nomes, extra])
+    nomes = nomes[:n_produtos]
+    codigos = np.array([f"{rng.integers(0, 10**10):010d}" for _ in range(n_produtos)])
+    return codigos, nomes
+
+def _zipf_pesos(n, s=1.1):
+    p = 1.0 / np.arange(1, n + 1) ** s
+    return p / p.sum()
+
+def _com_faltantes(valores, frac, rng):
+    """Troca uma fração dos valores por NaN (campos vazios no CSV)."""
+    valores = np.array(valores, dtype=float)
+    valores[rng.random(len(valores)) < frac] = np.nan
+    return valores
+
+def _datas(n, inicio, fim, rng):
+    ini, f = pd.Timestamp(inicio).value // 10**9, pd.Timestamp(fim).value // 10**9
+    return pd.to_datetime(rng.integers(ini, f, n), unit="s").strftime("%Y-%m-%d")
+
+def _salvar(df, pasta, nome, encoding="utf-8"):
+    # formato BR: ';' como separador e vírgula decimal
+    df.to_csv(os.path.join(pasta, nome), sep=";", decimal=",", index=False, encoding=encoding)
+
+def _linhas_ruins(pasta, nome, frac, rng, encoding="utf-8"):
+    """Insere linhas com colunas a mais (exercita on_bad_lines='skip' do ETL)."""
+    if frac <= 0:
+        return
+    caminho = os.path.join(pasta, nome)
+    with open(caminho, "r", encoding=encoding) as f:
+        linhas = f.readlines()
+    n = int(len(linhas) * frac)
+    if n == 0:
+        return
+    for i in rng.choice(np.arange(1, len(linhas)), size=n, replace=False):
+        linhas[i] = linhas[i].rstrip("\n") + ";;LIXO\n"
+    with open(caminho, "w", encoding=encoding) as f:
+        f.writelines(linhas)
+
+
+# ==============================
+# Geração
+# ==============================
+def gerar_dados_sinteticos(n_clientes, saida="dados_sinteticos", n_produtos=1500,
+                           produtos_por_cliente=3.0, frac_faltantes=0.02,
+                           frac_linhas_ruins=0.0005, seed=42):
+    """
+    Gera todos os arquivos lidos por etl_s3_totvs.py em `saida`.
+    Retorna dicionário {arquivo: linhas}.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(saida, exist_ok=True)
+    resumo = {}
+
+    # --- clientes ---
+    ids = np.char.add("T", np.char.zfill(np.arange(n_clientes).astype(str), 6)).astype(object)
+    segs = np.array(list(SEGMENTOS))
+    seg = rng.choice(segs, n_clientes, p=[0.2, 0.35, 0.3, 0.15])
+    subseg = np.array([SEGMENTOS[s][i % len(SEGMENTOS[s])] for s, i in
+                       zip(seg, rng.integers(0, 12, n_clientes))])
+    uf = rng.choice(UFS, n_clientes, p=_zipf_pesos(len(UFS), 1.0))
+    cidade = np.array([CIDADES[u][i % len(CIDADES[u])] for u, i in zip(uf, rng.integers(0, 12, n_clientes))])
+    faixa = rng.choice(FAIXAS, n_clientes, p=_zipf_pesos(len(FAIXAS), 0.6))
+    vl_contrato = np.round(rng.lognormal(10, 2, n_clientes), 8)
+    dt_assinatura = _datas(n_clientes, "2005-01-01", "2025-06-30", rng)
+
+    # Produtos por cliente: popularidade Zipf, ranking deslocado por segmento
+    codigos, nomes = _catalogo_produtos(n_produtos, rng)
+    pesos = _zipf_pesos(n_produtos)
+    qtd = np.maximum(1, rng.poisson(produtos_por_cliente, n_clientes))
+    dono = np.repeat(np.arange(n_clientes), qtd)
+    rank = rng.choice(n_produtos, len(dono), p=pesos)
+    desloc = {s: i * (n_produtos // 37 + 1) for i, s in enumerate(segs)}
+    desloc_dono = np.vectorize(desloc.get)(seg)[dono]
+    prod = (rank + desloc_dono) % n_produtos
+
+    clientes = pd.DataFrame({
+        "CD_CLIENTE": ids[dono],
+        "CIDADE": cidade[dono],
+        "DS_SEGMENTO": seg[dono],
+        "DS_SUBSEGMENTO": subseg[dono],
+        "UF": uf[dono],
+        "VL_TOTAL_CONTRATO": vl_contrato[dono],
+        "DT_ASSINATURA_CONTRATO": np.asarray(dt_assinatura)[dono],
+        "CD_PROD": codigos[prod],
+        "DS_PROD": nomes[prod],
+    }).drop_duplicates(["CD_CLIENTE", "CD_PROD"])
+    _salvar(clientes, saida, "dados_clientes.csv")
+    resumo["dados_clientes.csv"] = len(clientes)
+
+    desde = pd.DataFrame({
+        "CLIENTE": ids,
+        "DT_CLIENTE_DESDE": _datas(n_clientes, "2000-01-01", "2025-06-30", rng),
+    })
+    _salvar(desde, saida, "clientes_desde.csv")
+    resumo["clientes_desde.csv"] = len(desde)
+
+    # --- histórico de propostas ---
+    n_hist = int(n_clientes * 2.1)
+    cli_hist = rng.integers(0, n_clientes, n_hist)
+    prod_hist = (rng.choice(n_produtos, n_hist, p=pesos) + np.vectorize(desloc.get)(seg[cli_hist])) % n_produtos
+    vl_full = np.round(rng.lognormal(6, 1.5, n_hist), 10)
+    pct_desc = np.where(rng.random(n_hist) < 0.6, 0.0, np.round(rng.uniform(0, 60, n_hist), 10))
+    vl_total = np.round(vl_full * (1 - pct_desc / 100), 10)
+    historico = pd.DataFrame({
+        "NR_PROPOSTA": np.char.add("AA", rng.integers(0, 26**4, n_hist).astype(str)),
+        "ITEM_PROPOSTA": rng.integers(1, 15, n_hist),
+        "DT_UPLOAD": _datas(n_hist, "2022-01-01", "2025-06-30", rng),
+        "HOSPEDAGEM": rng.choice(["ON PREMISES", "CLOUD", "TOTVS CLOUD"], n_hist, p=[0.6, 0.25, 0.15]),
+        "CD_CLI": ids[cli_hist],
+        "FAT_FAIXA": faixa[cli_hist],
+        "CD_PROD": codigos[prod_hist],
+        "QTD": rng.integers(1, 20, n_hist),
+        "MESES_BONIF": rng.choice([0, 0, 0, 1, 2, 3], n_hist),
+        "VL_PCT_DESC_TEMP": 0,
+        "VL_PCT_DESCONTO": pct_desc,
+        "PRC_UNITARIO": vl_total,
+        "VL_DESCONTO_TEMPORARIO": 0,
+        "VL_TOTAL": vl_total,
+        "VL_FULL": vl_full,
+        "VL_DESCONTO": np.round(vl_full - vl_total, 10),
+    })
+    _salvar(historico, saida, "historico.csv")
+    _linhas_ruins(saida, "historico.csv", frac_linhas_ruins, rng)
+    resumo["historico.csv"] = len(historico)
+
+    # --- vendas (MRR + contratações) ---
+    com_mrr = rng.random(n_clientes) < 0.7
+    mrr = pd.DataFrame({
+        "CLIENTE": ids[com_mrr],
+        "MRR_12M": _com_faltantes(np.round(rng.lognormal(6, 1.3, com_mrr.sum()), 6), frac_faltantes, rng),
+    })
+    _salvar(mrr, saida, "mrr.csv")
+    resumo["mrr.csv"] = len(mrr)
+
+    com_contr = rng.random(n_clientes) < 0.45
+    qtd_contr = rng.geometric(0.5, com_contr.sum()).astype(float)
+    contratos = pd.DataFrame({
+        "CD_CLIENTE": ids[com_contr],
+        "QTD_CONTRATACOES_12M": qtd_contr,
+        "VLR_CONTRATACOES_12M": _com_faltantes(np.round(qtd_contr * rng.lognormal(7, 1.5, len(qtd_contr)), 10),
+                                               frac_faltantes, rng),
+    })
+    _salvar(contratos, saida, "contratacoes_ultimos_12_meses.csv")
+    resumo["contratacoes_ultimos_12_meses.csv"] = len(contratos)
+
+    # --- NPS (mesmo layout nos 6 arquivos) ---
+    for nome in ARQUIVOS_NPS:
+        n = int(n_clientes * (0.3 if nome == "nps_relacional.csv" else 0.1))
+        nota = np.clip(np.round(rng.normal(8, 2, n)), 0, 10)
+        nps = pd.DataFrame({
+            "metadata_codcliente": ids[rng.integers(0, n_clientes, n)],
+            "respondedAt": _datas(n, "2023-01-01", "2025-06-30", rng),
+            "resposta_NPS": pd.array(_com_faltantes(nota, frac_faltantes, rng), dtype="Int64"),
+            "resposta_unidade": rng.choice(["SP", "RJ", "SUL", "NE"], n),
+        })
+        _salvar(nps, saida, nome)
+        resumo[nome] = len(nps)
+
+    # --- tickets (sem CD_CLIENTE, apenas organização) ---
+    n_tk = int(n_clientes * 4)
+    tickets = pd.DataFrame({
+        "BK_TICKET": np.arange(1, n_tk + 1),
+        "CODIGO_ORGANIZACAO": ids[rng.choice(n_clientes, n_tk, p=_zipf_pesos(n_clientes, 0.8))],
+        "NOME_GRUPO": rng.choice(["N1", "N2", "PRODUTO", "FISCAL"], n_tk),
+        "TIPO_TICKET": rng.choice(["Dúvida", "Incidente", "Solicitação"], n_tk),
+        "STATUS_TICKET": rng.choice(["Fechado", "Resolvido", "Aberto", "Pendente"], n_tk, p=[0.6, 0.3, 0.05, 0.05]),
+        "DT_CRIACAO": _datas(n_tk, "2023-01-01", "2025-06-30", rng),
+        "PRIORIDADE_TICKET": rng.choice(["low", "normal", "high", "urgent"], n_tk, p=[0.2, 0.6, 0.15, 0.05]),
+    })
+    _salvar(tickets, saida, "tickets.csv")
+    resumo["tickets.csv"] = len(tickets)
+
+    # --- telemetria (11 partes) ---
+    n_tel = int(n_clientes * 1.5)
+    for i in range(1, N_TELEMETRIA + 1):
+        n = n_tel // N_TELEMETRIA
+        tel = pd.DataFrame({
+            "clienteid": ids[rng.integers(0, n_clientes, n)],
+            "eventduration": np.round(rng.exponential(300, n), 3),
+            "moduloid": rng.integers(1, 80, n),
+            "productlineid": rng.integers(1, 12, n),
+            "referencedatestart": _datas(n, "2024-07-01", "2025-06-30", rng),
+            "slotage": rng.integers(0, 120, n),
+            "statuslicenca": rng.choice(["ATIVA", "BLOQUEADA", "SUSPENSA"], n, p=[0.9, 0.05, 0.05]),
+            "tcloud": rng.integers(0, 2, n),
+        })
+        _salvar(tel, saida, f"telemetria_{i}.csv")
+        resumo[f"telemetria_{i}.csv"] = len(tel)
+
+    print(f" Dados sintéticos ({n_clientes} clientes) gerados em {saida}/")
+    return resumo
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Meraki Match – Gerador de dados sintéticos")
+    p.add_argument("--clientes", type=int, default=10000, help="Quantidade de clientes (padrão=10000)")
+    p.add_argument("--saida", default="dados_sinteticos", help="Pasta de saída (padrão: dados_sinteticos)")
+    p.add_argument("--produtos", type=int, default=1500, help="Tamanho do catálogo de produtos (padrão=1500)")
+    p.add_argument("--seed", type=int, default=42)
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    gerar_dados_sinteticos(args.clientes, args.saida, n_produtos=args.produtos, seed=args.seed)
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+Orçamento de inicialização da CLI (meraki.py): o --help da CLI e de cada
+subcomando precisa iniciar em até 200 ms, sem importar bibliotecas pesadas.
+
+    python -m pytest test_orcamento_import.py
+"""
+
+from benchmark_meraki import verificar_orcamento_import
+
+
+def test_orcamento_import_cli():
+    falhas = verificar_orcamento_import(limite_ms=200)
+    assert not falhas, "\n".join(falhas)
@@ -4,20 +4,26 @@ import os
 import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+
+from instrumentacao import etapa, registrar, resumo_execucao
+from perfil_clusters import COLS_CATEGORICAS, perfilar_clusters, rotular_clusters
+from relatorios import TAMANHO_LOTE, RelatorioXLSX, resolver_texto
 
 # --------------------------
 # Args
 # --------------------------
-def parse_args():
+def parse_args(argv=None):
     p = argparse.ArgumentParser(description="Meraki Match – Visuais Finais")
     p.add_argument("--upload", action="store_true", help="Faz upload dos artefatos para S3")
     p.add_argument("--bucket", default="", help="Bucket S3 (necessário se --upload)")
     p.add_argument("--prefix", default="outputs/", help="Prefixo/pasta no S3 (padrão: outputs/)")
     p.add_argument("--aws-key", default=os.environ.get("AWS_ACCESS_KEY_ID", ""), help="AWS Access Key (ou variável de ambiente)")
     p.add_argument("--aws-secret", default=os.environ.get("AWS_SECRET_ACCESS_KEY", ""), help="AWS Secret Key (ou variável de ambiente)")
+    p.add_argument("--destino-local", default="", help="Publica os artefatos nesta pasta em vez do S3")
     p.add_argument("--topn", type=int, default=8, help="Qtde de features com maior variância para o gráfico (padrão=8)")
-    return p.parse_args()
+    p.add_argument("--planilha-clientes", action="store_true",
+                   help="Exporta também recomendacoes_por_cliente.xlsx (streaming, dividida em abas)")
+    return p.parse_args(argv)
 
 # --------------------------
 # Helpers
@@ -25,7 +31,9 @@ def parse_args():
 def safe_read_csv(path):
     if not os.path.exists(path):
         raise FileNotFoundError(f"Arquivo não encontrado: {path}")
-    return pd.read_csv(path, encoding="utf-8")
+    df = pd.read_csv(path, encoding="utf-8")
+    registrar("linhas_entrada", len(df))
+    return df
 
 def to_numeric_br(series: pd.Series) -> pd.Series:
     s = (
@@ -44,14 +52,43 @@ def ensure_cd_cliente(df: pd.DataFrame) -> pd.DataFrame:
         df["CD_CLIENTE"] = df[hit[0]]
     return df
 
+NUM_COLS_BASE = ["MRR_12M", "NPS_MEDIO", "QTD_CONTRATACOES_12M", "VLR_CONTRATACOES_12M", "VL_TOTAL_CONTRATO"]
+_cache_perfil = {}
+
+def perfil_base(base_csv="base_analitica_meraki.csv", clusters_csv="clusters_clientes.csv"):
+    """
+    Lê base + clusters, converte as métricas e calcula o perfil dos clusters
+    (perfil_clusters.perfilar_clusters) uma única vez para todos os gráficos e
+    rótulos. O cache é refeito se algum dos arquivos mudar.
+    Retorna (df, perfil).
+    """
+    for path in (base_csv, clusters_csv):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Arquivo não encontrado: {path}")
+    chave = tuple((os.path.abspath(p), os.stat(p).st_mtime_ns, os.stat(p).st_size)
+                  for p in (base_csv, clusters_csv))
+    if chave not in _cache_perfil:
+        base = ensure_cd_cliente(safe_read_csv(base_csv))
+        clusters = safe_read_csv(clusters_csv)
+        df = base.merge(clusters[["CD_CLIENTE", "cluster"]], on="CD_CLIENTE", how="left")
+        cols = [c for c in NUM_COLS_BASE if c in df.columns]
+        for c in cols:
+            df[c] = to_numeric_br(df[c]) if not pd.api.types.is_numeric_dtype(df[c]) else pd.to_numeric(df[c], errors="coerce")
+        _cache_perfil.clear()
+        _cache_perfil[chave] = (df, perfilar_clusters(df, num_cols=cols, cat_cols=COLS_CATEGORICAS))
+    return _cache_perfil[chave]
+
 # --------------------------
 # 1) Gráficos para PPT
 # --------------------------
+@etapa
 def grafico_distribuicao_clusters(clusters_csv="clusters_clientes.csv", saida_png="cluster_sizes.png"):
     df = safe_read_csv(clusters_csv)
     if "cluster" not in df.columns:
         raise ValueError("clusters_clientes.csv precisa ter a coluna 'cluster'.")
     sizes = df["cluster"].value_counts().sort_index()
+
+    import matplotlib.pyplot as plt
     plt.figure()
     sizes.plot(kind="bar")
     plt.title("Distribuição de Clientes por Cluster")
@@ -62,6 +99,7 @@ def grafico_distribuicao_clusters(clusters_csv="clusters_clientes.csv", saida_pn
     plt.close()
     print(f"✅ {saida_png} gerado.")
 
+@etapa
 def grafico_medias_features(cluster_summary_xlsx="cluster_summary.xlsx",
                             base_csv="base_analitica_meraki.csv",
                             clusters_csv="clusters_clientes.csv",
@@ -83,26 +121,14 @@ def grafico_medias_features(cluster_summary_xlsx="cluster_summary.xlsx",
 
     if perfil is None:
         print("⚠️ Recalculando perfil de features a partir de base + clusters (fallback).")
-        base = safe_read_csv(base_csv)
-        clusters = safe_read_csv(clusters_csv)
-        base = ensure_cd_cliente(base)
-        df = base.merge(clusters[["CD_CLIENTE","cluster"]], on="CD_CLIENTE", how="left")
-        # escolhe colunas numéricas
-        num_cols = []
-        for c in df.columns:
-            if c in ("CD_CLIENTE","cluster"):
-                continue
-            # tenta converter para numérico
-            s = to_numeric_br(df[c]) if df[c].dtype == "O" else pd.to_numeric(df[c], errors="coerce")
-            if s.notna().sum() > 0:
-                df[c] = s
-                num_cols.append(c)
-        perfil = df.groupby("cluster")[num_cols].mean(numeric_only=True)
+        _, perfil_clusters = perfil_base(base_csv, clusters_csv)
+        perfil = perfil_clusters["medias"]
 
     # Seleciona top N features por variância entre clusters
     variancias = perfil.var().sort_values(ascending=False)
     features_top = variancias.head(topn).index.tolist() if len(variancias) > 0 else perfil.columns.tolist()
 
+    import matplotlib.pyplot as plt
     ax = perfil[features_top].plot(kind="bar", figsize=(10,5))
     ax.set_title("Médias das Principais Features por Cluster")
     ax.set_xlabel("Cluster")
@@ -112,6 +138,7 @@ def grafico_medias_features(cluster_summary_xlsx="cluster_summary.xlsx",
     plt.close()
     print(f"✅ {saida_png} gerado.")
 
+@etapa
 def planilha_top_produtos(recs_cluster_csv="recomendacoes_por_cluster.csv",
                           saida_xlsx="top_produtos_por_cluster.xlsx"):
     df = safe_read_csv(recs_cluster_csv)
@@ -121,112 +148,107 @@ def planilha_top_produtos(recs_cluster_csv="recomendacoes_por_cluster.csv",
     if "QTD" in df.columns:
         df["QTD"] = pd.to_numeric(df["QTD"], errors="coerce")
     df = df.sort_values(["cluster", "QTD"], ascending=[True, False])
-    with pd.ExcelWriter(saida_xlsx, engine="xlsxwriter") as xlw:
-        df.to_excel(xlw, index=False, sheet_name="top_produtos")
+    with RelatorioXLSX(saida_xlsx) as rel:
+        rel.escrever("top_produtos", df)
     print(f"✅ {saida_xlsx} gerado.")
 
+@etapa
+def planilha_recomendacoes_clientes(recs_cliente_csv="recomendacoes_por_cliente.csv",
+                                    saida_xlsx="recomendacoes_por_cliente.xlsx"):
+    """Copia o CSV (ou .csv.gz) para XLSX em lotes; passa de aba ao atingir o limite do Excel."""
+    recs_cliente_csv = resolver_texto(recs_cliente_csv)
+    if not os.path.exists(recs_cliente_csv):
+        raise FileNotFoundError(f"Arquivo não encontrado: {recs_cliente_csv}")
+    lotes = pd.read_csv(recs_cliente_csv, encoding="utf-8", chunksize=TAMANHO_LOTE)
+    with RelatorioXLSX(saida_xlsx) as rel:
+        total = rel.escrever("recomendacoes", lotes)
+    registrar("linhas_entrada", total)
+    print(f"✅ {saida_xlsx} gerado ({total} linhas em {len(rel.abas)} aba(s)).")
+
 # --------------------------
 # 2) Rótulos legíveis (personas)
 # --------------------------
+@etapa
 def gerar_rotulos_clusters(base_csv="base_analitica_meraki.csv",
                            clusters_csv="clusters_clientes.csv",
                            saida_csv="clusters_rotulados.csv"):
-    base = safe_read_csv(base_csv)
-    clusters = safe_read_csv(clusters_csv)
-    base = ensure_cd_cliente(base)
-
-    df = base.merge(clusters, on="CD_CLIENTE", how="left")
-    cols = [c for c in ["MRR_12M","NPS_MEDIO","QTD_CONTRATACOES_12M","VLR_CONTRATACOES_12M","VL_TOTAL_CONTRATO"] if c in df.columns]
-
-    for c in cols:
-        df[c] = to_numeric_br(df[c]) if df[c].dtype == "O" else pd.to_numeric(df[c], errors="coerce")
+    df, perfil = perfil_base(base_csv, clusters_csv)
 
-    perfil = df.groupby("cluster")[cols].mean(numeric_only=True).reset_index()
-
-    def tercil(series):
-        return series.quantile([0.33, 0.67]).values
-
-    thresholds = {c: tercil(perfil[c]) for c in cols if c in perfil.columns}
-
-    def bucket(v, q33, q67):
-        if np.isnan(v): return "Médio"
-        if v <= q33:    return "Baixo"
-        if v >= q67:    return "Alto"
-        return "Médio"
-
-    def rotular(row):
-        parts = []
-        if "MRR_12M" in cols:
-            q1,q2 = thresholds["MRR_12M"]; parts.append(f"Receita {bucket(row['MRR_12M'], q1, q2)}")
-        if "NPS_MEDIO" in cols:
-            q1,q2 = thresholds["NPS_MEDIO"]; parts.append(f"Satisfação {bucket(row['NPS_MEDIO'], q1, q2)}")
-        if "QTD_CONTRATACOES_12M" in cols:
-            q1,q2 = thresholds["QTD_CONTRATACOES_12M"]; parts.append(f"Aquisição {bucket(row['QTD_CONTRATACOES_12M'], q1, q2)}")
-        return ", ".join(parts[:3])
-
-    perfil["cluster_label"] = perfil.apply(rotular, axis=1)
-    out = df.merge(perfil[["cluster","cluster_label"]], on="cluster", how="left")
+    # rótulo por cluster (np.select sobre as médias) e mapeado para os clientes
+    rotulos = rotular_clusters(perfil["medias"])
+    out = df[["CD_CLIENTE", "cluster"]].copy()
+    out["cluster_label"] = out["cluster"].map(rotulos)
     out[["CD_CLIENTE","cluster","cluster_label"]].to_csv(saida_csv, index=False, encoding="utf-8")
     print(f"✅ {saida_csv} gerado.")
 
 # --------------------------
 # 3) Upload opcional para S3
 # --------------------------
-def upload_s3(arquivos, bucket, prefix, aws_key, aws_secret):
-    import boto3
-    s3 = boto3.client("s3",
-        aws_access_key_id=aws_key if aws_key else None,
-        aws_secret_access_key=aws_secret if aws_secret else None,
-    )
+@etapa
+def publicar(arquivos, armazenamento):
+    """Envia os artefatos em paralelo para o armazenamento (S3 ou pasta local)."""
+    from armazenamento import enviar_varios, executar
+    enviados = executar(enviar_varios(armazenamento, arquivos))
     for f in arquivos:
-        if os.path.exists(f):
-            s3.upload_file(f, bucket, prefix + f)
-            print(f"☁️  Enviado: s3://{bucket}/{prefix}{f}")
-        else:
+        res = enviados.get(f)
+        if res is None:
             print(f"⚠️ Não encontrado (skip): {f}")
+        elif isinstance(res, Exception):
+            print(f"⚠️ Falha ao enviar {f}: {res}")
+        else:
+            print(f"☁️  Enviado: {res}")
+
+def upload_s3(arquivos, bucket, prefix, aws_key, aws_secret):
+    from armazenamento import ArmazenamentoS3
+    publicar(arquivos, ArmazenamentoS3(bucket, prefix, aws_key, aws_secret))
 
 # --------------------------
 # MAIN
 # --------------------------
-def main():
-    args = parse_args()
+def main(argv=None):
+    args = parse_args(argv)
 
     # Gráficos
     grafico_distribuicao_clusters()
     grafico_medias_features(topn=args.topn)
     planilha_top_produtos()
+    if args.planilha_clientes:
+        planilha_recomendacoes_clientes()
 
     # Rótulos legíveis
     gerar_rotulos_clusters()
 
     # Upload opcional
-    if args.upload:
+    arquivos = [
+        "cluster_sizes.png",
+        "cluster_feature_means.png",
+        "top_produtos_por_cluster.xlsx",
+        "clusters_rotulados.csv",
+    ]
+    if args.planilha_clientes:
+        arquivos.append("recomendacoes_por_cliente.xlsx")
+    if args.destino_local:
+        from armazenamento import ArmazenamentoLocal
+        publicar(arquivos, ArmazenamentoLocal(args.destino_local))
+    elif args.upload:
         if not args.bucket:
             raise ValueError("Para --upload, informe --bucket.")
-        arquivos = [
-            "cluster_sizes.png",
-            "cluster_feature_means.png",
-            "top_produtos_por_cluster.xlsx",
-            "clusters_rotulados.csv",
-        ]
         upload_s3(arquivos, args.bucket, args.prefix, args.aws_key, args.aws_secret)
 
     print(" Visuais finais concluídos.")
+    resumo_execucao()
 
 # Gráficos
 
+@etapa
 def grafico_nps_medio_por_cluster(base_csv="base_analitica_meraki.csv",
                                   clusters_csv="clusters_clientes.csv",
                                   saida_png="nps_por_cluster.png"):
-    base = safe_read_csv(base_csv)
-    clusters = safe_read_csv(clusters_csv)
-    base = ensure_cd_cliente(base)
-    df = base.merge(clusters, on="CD_CLIENTE", how="left")
-    if "NPS_MEDIO" not in df.columns:
+    _, perfil = perfil_base(base_csv, clusters_csv)
+    if "NPS_MEDIO" not in perfil["medias"].columns:
         print(" NPS_MEDIO não encontrado em base_analitica_meraki.csv")
         return
-    df["NPS_MEDIO"] = to_numeric_br(df["NPS_MEDIO"]) if df["NPS_MEDIO"].dtype == "O" else pd.to_numeric(df["NPS_MEDIO"], errors="coerce")
-    nps = df.groupby("cluster", as_index=False)["NPS_MEDIO"].mean()
+    nps = perfil["medias"]["NPS_MEDIO"].reset_index()
 
     import matplotlib.pyplot as plt
     plt.figure()
@@ -237,50 +259,43 @@ def grafico_nps_medio_por_cluster(base_csv="base_analitica_meraki.csv",
     plt.tight_layout(); plt.savefig(saida_png, dpi=200); plt.close()
     print(f"✅ {saida_png} gerado.")
 
+@etapa
 def grafico_boxplot_mrr_por_cluster(base_csv="base_analitica_meraki.csv",
                                     clusters_csv="clusters_clientes.csv",
                                     saida_png="mrr_boxplot_por_cluster.png"):
-    base = safe_read_csv(base_csv)
-    clusters = safe_read_csv(clusters_csv)
-    base = ensure_cd_cliente(base)
-    df = base.merge(clusters, on="CD_CLIENTE", how="left")
-    if "MRR_12M" not in df.columns:
+    _, perfil = perfil_base(base_csv, clusters_csv)
+    if "mrr" not in perfil:
         print("⚠️ MRR_12M não encontrado em base_analitica_meraki.csv")
         return
-    df["MRR_12M"] = to_numeric_br(df["MRR_12M"]) if df["MRR_12M"].dtype == "O" else pd.to_numeric(df["MRR_12M"], errors="coerce")
-
-    grupos = []
-    labels = []
-    for cl in sorted(df["cluster"].dropna().unique()):
-        serie = df.loc[df["cluster"]==cl, "MRR_12M"].dropna()
-        if len(serie) > 0:
-            grupos.append(serie.values)
-            labels.append(str(cl))
-    if not grupos:
+
+    # estatísticas já calculadas pelo motor de perfil (sem reagrupar os clientes)
+    mrr = perfil["mrr"][perfil["mrr"]["n"] > 0]
+    if mrr.empty:
         print("⚠️ Sem dados suficientes para boxplot de MRR.")
         return
+    stats = [{"label": str(cl), "q1": r.q1, "med": r.mediana, "q3": r.q3,
+              "whislo": r.bigode_inf, "whishi": r.bigode_sup, "fliers": []}
+             for cl, r in mrr.iterrows()]
 
     import matplotlib.pyplot as plt
     plt.figure()
-    plt.boxplot(grupos, labels=labels, showfliers=False)
+    plt.gca().bxp(stats, showfliers=False)
     plt.title("Distribuição de MRR por Cluster (Boxplot)")
     plt.xlabel("Cluster"); plt.ylabel("MRR (12M)")
     plt.tight_layout(); plt.savefig(saida_png, dpi=200); plt.close()
     print(f"✅ {saida_png} gerado.")
 
+@etapa
 def grafico_composicao_segmento(base_csv="base_analitica_meraki.csv",
                                 clusters_csv="clusters_clientes.csv",
                                 saida_png="segmento_stack_por_cluster.png"):
-    base = safe_read_csv(base_csv)
-    clusters = safe_read_csv(clusters_csv)
-    base = ensure_cd_cliente(base)
-    df = base.merge(clusters, on="CD_CLIENTE", how="left")
+    _, perfil = perfil_base(base_csv, clusters_csv)
 
-    if "DS_SEGMENTO" not in df.columns:
+    if "DS_SEGMENTO" not in perfil["composicao"]:
         print("⚠️ DS_SEGMENTO não encontrado em base_analitica_meraki.csv")
         return
 
-    tab = pd.crosstab(df["cluster"], df["DS_SEGMENTO"])
+    tab = perfil["composicao"]["DS_SEGMENTO"]
     if tab.empty:
         print("⚠️ Tabela vazia para composição por segmento.")
         return
@@ -300,6 +315,7 @@ def grafico_composicao_segmento(base_csv="base_analitica_meraki.csv",
     plt.tight_layout(); plt.savefig(saida_png, dpi=200); plt.close()
     print(f"✅ {saida_png} gerado.")
 
+@etapa
 def grafico_top_produtos_por_cluster(recs_cluster_csv="recomendacoes_por_cluster.csv",
                                      saida_dir="top_produtos_imgs",
                                      top_n=10):
@@ -311,11 +327,11 @@ def grafico_top_produtos_por_cluster(recs_cluster_csv="recomendacoes_por_cluster
         df["QTD"] = pd.to_numeric(df["QTD"], errors="coerce").fillna(0)
     os.makedirs(saida_dir, exist_ok=True)
 
+    import matplotlib.pyplot as plt
     for cl in sorted(df["cluster"].unique()):
         top = df[df["cluster"]==cl].sort_values("QTD", ascending=False).head(top_n)
         if top.empty:
             continue
-        import matplotlib.pyplot as plt
         plt.figure(figsize=(8,6))
         plt.barh(top["DS_PROD"].astype(str)[::-1], top["QTD"].values[::-1])
         plt.title(f"Top {top_n} Produtos — Cluster {cl}")
@@ -325,9 +341,8 @@ def grafico_top_produtos_por_cluster(recs_cluster_csv="recomendacoes_por_cluster
         plt.savefig(out, dpi=200); plt.close()
         print(f"✅ {out} gerado.")
 
-# ---- EXEMPLO: chamar os extras logo após o main do seu script ----
-if __name__ == "__main__":
-    # (se você já tem o main acima, pode apenas chamar os extras aqui embaixo)
+# ---- Extras: gráficos adicionais, cada um isolado para não interromper os demais ----
+def extras():
     try:
         grafico_nps_medio_por_cluster()
     except Exception as e:
@@ -347,4 +362,5 @@ if __name__ == "__main__":
 
 
 if __name__ == "__main__":
+    extras()
     main()